@@ -0,0 +1,294 @@
+import asyncio
+import traceback
+from collections import Counter, namedtuple
+
+import discord
+
+from discordbasics import rest_call
+
+
+# action is one of create_category, update_category, create, move,
+# delete or delete_category. category is the name of the category the
+# step is for, channel the existing discord object it acts on (if any),
+# and position the channel's place within its category
+LayoutStep = namedtuple('LayoutStep','action category name channel position')
+
+
+class LayoutResult():
+    """
+    What apply_layout did: the steps done, those left alone
+    (e.g. channels with people still in them) and those that failed
+    """
+    def __init__(self):
+        self.done = []
+        self.skipped = [] # [(step, reason)]
+        self.failed = []  # [(step, error)]
+
+
+    def text(self):
+        counts = Counter(step.action for step in self.done)
+        summary = ', '.join(f'{count} {action}' for action, count in counts.items()) or 'no changes'
+        if self.skipped:
+            summary += f', {len(self.skipped)} skipped'
+        if self.failed:
+            summary += f', {len(self.failed)} failed'
+        return summary
+
+
+    def problems(self):
+        """
+        One line per skipped or failed step
+        """
+        return ([f'Skipped {step.action} {step.name}: {reason}' for step, reason in self.skipped] +
+                [f'Failed {step.action} {step.name}: {error}' for step, error in self.failed])
+
+
+def stable_positions(indices):
+    """
+    Returns the positions in indices that are part of a longest
+    increasing run, i.e. the channels that can stay where they are
+    while the rest are moved around them
+    """
+    best = [1]*len(indices)
+    previous = [None]*len(indices)
+    for i in range(len(indices)):
+        for j in range(i):
+            if indices[j] < indices[i] and best[j]+1 > best[i]:
+                best[i] = best[j]+1
+                previous[i] = j
+
+    stable = set()
+    i = max(range(len(indices)),key=best.__getitem__,default=None)
+    while i is not None:
+        stable.add(i)
+        i = previous[i]
+    return stable
+
+
+def plan_layout(guild,layout,overwrites=None,remove=()):
+    """
+    Returns the LayoutSteps that turn the guild's voice channels into
+    layout ({category name : [voice channel names]}, in order).
+
+    Channels already in place are left alone. A channel the layout wants
+    that sits in another of the categories is moved rather than remade,
+    and channels in the categories that the layout doesn't list are
+    deleted. Categories named in remove are deleted with their channels.
+    overwrites, if given, are set on every category of the layout.
+    """
+    steps = []
+    managed = [category for category in guild.categories if category.name in layout or category.name in remove]
+    categories = {category.name : category for category in managed}
+    claimed = set() # ids of channels the layout keeps
+
+    # Channels already in the right category
+    placed = {} # {(category name, channel name) : channel}
+    for categoryName, channelNames in layout.items():
+        category = categories.get(categoryName)
+        if category is None:
+            continue
+        for name in channelNames:
+            channel = discord.utils.find(lambda c: c.name == name and c.id not in claimed,category.voice_channels)
+            if channel is not None:
+                claimed.add(channel.id)
+                placed[(categoryName,name)] = channel
+
+    for categoryName, channelNames in layout.items():
+        category = categories.get(categoryName)
+        if category is None:
+            steps.append(LayoutStep('create_category',categoryName,categoryName,None,None))
+        elif overwrites is not None and category.overwrites != overwrites:
+            steps.append(LayoutStep('update_category',categoryName,categoryName,category,None))
+
+        # Channels we keep, in their current order, and where they should go
+        kept = [] if category is None else [channel for channel in category.voice_channels if placed.get((categoryName,channel.name)) is channel]
+        wanted = [channelNames.index(channel.name) for channel in kept]
+        stable = stable_positions(wanted)
+        for i, channel in enumerate(kept):
+            if i not in stable:
+                steps.append(LayoutStep('move',categoryName,channel.name,channel,wanted[i]))
+
+        lastKept = max(wanted,default=-1)
+        for position, name in enumerate(channelNames):
+            if (categoryName,name) in placed:
+                continue
+            other = None
+            for otherCategory in managed:
+                if otherCategory.name != categoryName:
+                    other = other or discord.utils.find(lambda c: c.name == name and c.id not in claimed,otherCategory.voice_channels)
+            if other is not None:
+                claimed.add(other.id)
+                steps.append(LayoutStep('move',categoryName,name,other,position))
+            else:
+                steps.append(LayoutStep('create',categoryName,name,None,position))
+                # New channels land after the existing ones, so one that
+                # belongs in between has to be moved into place as well
+                if category is not None and position < lastKept:
+                    steps.append(LayoutStep('move',categoryName,name,None,position))
+
+    for category in managed:
+        for channel in category.voice_channels:
+            if channel.id not in claimed:
+                steps.append(LayoutStep('delete',category.name,channel.name,channel,None))
+        if category.name not in layout:
+            steps.append(LayoutStep('delete_category',category.name,category.name,category,None))
+
+    return steps
+
+
+def position_payload(category,order):
+    """
+    Returns the [{'id', 'position', 'parent_id'}] entries that put the
+    channels of order into category in that order. The raw positions
+    they already hold are shared out again, so channels elsewhere in the
+    guild keep theirs. Channels that don't change are left out.
+    """
+    positions = sorted(channel.position for channel in order)
+    for i in range(1,len(positions)):
+        positions[i] = max(positions[i],positions[i-1]+1)
+    payload = []
+    for channel, position in zip(order,positions):
+        entry = {'id' : channel.id, 'position' : position}
+        if channel.category_id != category.id:
+            entry['parent_id'] = category.id
+        if channel.position != position or 'parent_id' in entry:
+            payload.append(entry)
+    return payload
+
+
+async def update_positions(guild,channels,payload,budget):
+    """
+    Sends a position_payload for channels.
+
+    discord.py has no public call for this, so it goes through the same
+    bulk update that channel.move uses, which takes (guild id, payload)
+    in discord.py 1.7 and 2.x. On any other version each channel is
+    edited on its own instead. That takes a call per channel, and can
+    be thrown off by discord.py renumbering from a cache that is behind.
+    """
+    bulk = getattr(guild._state.http,'bulk_channel_update',None)
+    if bulk is not None and discord.version_info.major in (1,2):
+        await rest_call(budget,bulk,guild.id,payload)
+        return
+
+    channels = {channel.id : channel for channel in channels}
+    for entry in payload:
+        options = {'position' : entry['position']}
+        if 'parent_id' in entry:
+            options['category'] = guild.get_channel(entry['parent_id'])
+        await rest_call(budget,channels[entry['id']].edit,**options)
+
+
+async def apply_layout(guild,steps,budget,overwrites=None,holding=None):
+    """
+    Carries out the steps from plan_layout, returning a LayoutResult.
+
+    Categories are made first, in order. Channel creates and deletes
+    then run together, all inside budget. Moves follow as one position
+    update per category, and emptied categories go last.
+
+    People in a channel being deleted are moved to the holding voice
+    channel first. Without one, the channel is skipped, and so is its
+    category.
+    """
+    result = LayoutResult()
+    categories = {category.name : category for category in guild.categories}
+    # The cache catches up with creates and deletes later, so the moves work from this
+    before = {category.name : list(category.voice_channels) for category in guild.categories}
+    created = {} # {(category name, channel name) : channel}
+
+    async def run(step,function,*args,**kwargs):
+        try:
+            value = await rest_call(budget,function,*args,**kwargs)
+            result.done.append(step)
+            return value
+        except discord.errors.HTTPException as error:
+            traceback.print_exc()
+            result.failed.append((step,error))
+            return None
+
+    async def delete_channel(step):
+        members = list(step.channel.members)
+        if members and holding is None:
+            result.skipped.append((step,f'{len(members)} still in it'))
+            return
+        if members:
+            moved = await asyncio.gather(*(rest_call(budget,member.move_to,holding) for member in members),return_exceptions=True)
+            if any(isinstance(outcome,Exception) for outcome in moved):
+                result.failed.append((step,f'could not move everyone to {holding.name}'))
+                return
+        await run(step,step.channel.delete)
+
+    async def create_channel(step,category,position):
+        channel = await run(step,guild.create_voice_channel,step.name,category=category,position=position)
+        if channel is not None:
+            created[(step.category,step.name)] = channel
+
+    for step in steps:
+        if step.action == 'create_category':
+            category = await run(step,guild.create_category,name=step.name,overwrites=overwrites)
+            if category is not None:
+                categories[step.name] = category
+    await asyncio.gather(*(run(step,step.channel.edit,overwrites=overwrites)
+                           for step in steps if step.action == 'update_category'))
+
+    # Where to put new channels in categories that already have some
+    nextPosition = {}
+    for step in steps:
+        if step.action == 'create' and step.category in categories and step.category not in nextPosition:
+            nextPosition[step.category] = max((channel.position+1 for channel in categories[step.category].voice_channels),default=0)
+
+    tasks = []
+    for step in steps:
+        category = categories.get(step.category)
+        if step.action == 'create':
+            if category is None:
+                result.failed.append((step,'category was not created'))
+                continue
+            position = nextPosition.get(step.category,0) + step.position
+            tasks.append(create_channel(step,category,position))
+        elif step.action == 'delete':
+            tasks.append(delete_channel(step))
+    await asyncio.gather(*tasks)
+
+    # channel.edit(position=) counts positions across every voice channel in
+    # the guild, so each category's order is worked out here and sent at once
+    moves = {} # {category name : [(step, channel)]}
+    for step in steps:
+        if step.action != 'move':
+            continue
+        channel = step.channel or created.get((step.category,step.name))
+        if step.category not in categories:
+            result.failed.append((step,'category was not created'))
+        elif channel is None:
+            result.failed.append((step,'channel was not created'))
+        else:
+            moves.setdefault(step.category,[]).append((step,channel))
+
+    deleted = {step.channel.id for step in result.done if step.action == 'delete'}
+    for categoryName, moved in moves.items():
+        category = categories[categoryName]
+        movedIDs = {channel.id for step, channel in moved}
+        order = [channel for channel in before.get(categoryName,[]) if channel.id not in deleted]
+        order += [created[(categoryName,step.name)] for step in steps
+                  if step.action == 'create' and step.category == categoryName and (categoryName,step.name) in created]
+        order = [channel for channel in order if channel.id not in movedIDs]
+        # Placing moves front to back leaves every earlier channel where it belongs
+        for step, channel in sorted(moved,key=lambda entry: entry[0].position):
+            order.insert(step.position,channel)
+
+        try:
+            await update_positions(guild,order,position_payload(category,order),budget)
+            result.done.extend(step for step, channel in moved)
+        except discord.errors.HTTPException as error:
+            traceback.print_exc()
+            result.failed.extend((step,error) for step, channel in moved)
+
+    # Categories that still have channels in them are left
+    notEmpty = {step.category for step, reason in result.skipped + result.failed if step.action == 'delete'}
+    for step in steps:
+        if step.action == 'delete_category' and step.category in notEmpty:
+            result.skipped.append((step,'channels left in it'))
+    await asyncio.gather(*(run(step,step.channel.delete)
+                           for step in steps if step.action == 'delete_category' and step.category not in notEmpty))
+    return result
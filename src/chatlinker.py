@@ -2,6 +2,14 @@ import discord
 from discord.ext import commands
 import settings
 import asyncio
+import contextlib
+import time
+import traceback
+from collections import deque
+
+from coalesce import CoalescingQueue
+from chatpool import ChatPool, LatencyHistogram
+from chatstore import ChatStore
 
 class ChatLinker(commands.Cog):
     """
@@ -12,79 +20,315 @@ class ChatLinker(commands.Cog):
     def __init__(self,bot):
         self.bot = bot
         
-        self.lock = asyncio.Lock()
+        # One lock per voice channel, so moves between unrelated
+        # channels don't wait on each other
+        self.channelLocks = {} # {channel_id : asyncio.Lock}
         
         self.charDict = {} # {channel_id : chat_channel_id }
+        self.store = ChatStore(settings.CHAT_DB)
+        self.started = False
+        self.lastSweep = 'No sweep yet'
+
+        # Who should see each chat channel. Changes are collected for
+        # CHAT_PERMISSION_WINDOW seconds, then written in one edit.
+        self.chatMembers = {} # {chat_channel_id : {member_id : member}}
+        self.chatWritten = {} # {chat_channel_id : frozenset of member ids last written}
+        self.permissionQueue = CoalescingQueue(settings.CHAT_PERMISSION_WINDOW)
+        self.permissionRequests = 0 # Member adds/removes asked for
+        self.permissionEdits = 0    # channel.edit calls actually made
+
+        # Hidden chat channels ready to be handed out, and how long
+        # members wait between joining voice and seeing the chat
+        self.pool = ChatPool(settings.CHAT_POOL_SIZE,settings.CHAT_POOL_MAX,settings.CHAT_POOL_IDLE,
+                             settings.CHAT_POOL_RECYCLE_MESSAGES,bot.restBudget)
+        self.poolTask = None
+        self.joinTimes = {} # {chat_channel_id : {member_id : time of voice join}}
+        self.joinLatency = LatencyHistogram()
+
+        # Chats wait for people to settle before being made, and are
+        # kept for a while after their VC empties
+        self.createQueue = CoalescingQueue(settings.CHAT_CREATE_DWELL)
+        self.teardownQueue = CoalescingQueue(settings.CHAT_TEARDOWN_GRACE)
+        self.createsSkipped = 0     # VCs emptied before the dwell time
+        self.teardownsCancelled = 0 # VCs rejoined inside the grace period
+        self.chatCalls = {'create' : deque(), 'delete' : deque()} # times of chat creates/deletes
         super().__init__()
         
     
+    def get_channel_lock(self,channelID):
+        """
+        Returns the lock for a voice channel, creating
+        it the first time the channel is seen
+        """
+        lock = self.channelLocks.get(channelID)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.channelLocks[channelID] = lock
+        return lock
+
+
+    async def shutdown(self):
+        """
+        Writes any permission changes still waiting
+        """
+        if self.poolTask is not None:
+            self.poolTask.cancel()
+        for key in list(self.createQueue.pending.keys()):
+            self.createQueue.discard(key)
+        await self.teardownQueue.flush_all()
+        await self.permissionQueue.flush_all()
+        await self.store.close()
+
+
+    @commands.Cog.listener('on_ready')
+    async def start_chats(self):
+        """
+        Takes back spare and linked chats left from before
+        a restart and starts keeping the pool topped up
+        """
+        if self.started:
+            return
+        self.started = True
+
+        await self.store.start()
+        for guild in self.bot.guilds:
+            for channel in guild.text_channels:
+                if channel.name == ChatPool.POOL_NAME and channel.category is None and ChatPool.made_by_bot(channel):
+                    self.pool.adopt(channel)
+        try:
+            await self.sweep_chats()
+        except Exception:
+            traceback.print_exc()
+        self.poolTask = asyncio.get_event_loop().create_task(self.pool_loop())
+
+
+    def chat_channel_name(voiceChannel):
+        """
+        The name Discord gives a chat made for voiceChannel
+        """
+        return f'{voiceChannel.name} chat'.lower().replace(' ','-')
+
+
+    async def sweep_chats(self):
+        """
+        Matches chats left from before a restart to their VCs, using the
+        stored links, or for chats made before links were stored, the chat
+        name and the bot's overwrites. Chats of occupied VCs are adopted,
+        the rest are released.
+        """
+        startTime = time.perf_counter()
+        links = await self.store.load()
+
+        found = {} # {chat_channel_id : [voice_id, voice channel or None, chat channel]}
+        for guild in self.bot.guilds:
+            textChannels = {channel.id : channel for channel in guild.text_channels}
+
+            for voiceID, chatID in links.items():
+                if chatID in textChannels:
+                    found[chatID] = [voiceID,guild.get_channel(voiceID),textChannels[chatID]]
+
+            for voiceChannel in guild.voice_channels:
+                if voiceChannel.id in links:
+                    continue
+                name = ChatLinker.chat_channel_name(voiceChannel)
+                for chatChannel in textChannels.values():
+                    # A human-made channel can share the name, so it must look like one of ours too
+                    if (chatChannel.id not in found and chatChannel.name == name and
+                            chatChannel.category == voiceChannel.category and ChatPool.made_by_bot(chatChannel)):
+                        found[chatChannel.id] = [voiceChannel.id,voiceChannel,chatChannel]
+                        break
+
+        # Links to chats that no longer exist
+        for voiceID, chatID in links.items():
+            if chatID not in found:
+                await self.store.unlink(voiceID)
+
+        semaphore = asyncio.Semaphore(settings.CHAT_SWEEP_CONCURRENCY)
+        results = await asyncio.gather(*(self.sweep_chat(semaphore,*entry) for entry in found.values()),return_exceptions=True)
+
+        for result in results:
+            if isinstance(result,Exception):
+                print(f'Chat sweep failed: {result!r}')
+        adopted = results.count('adopted')
+        released = results.count('released')
+        failed = len(results) - adopted - released
+        self.lastSweep = f'Startup sweep: {len(results)} chats in {time.perf_counter()-startTime:.3f}s, {adopted} adopted, {released} released, {failed} failed'
+        print(self.lastSweep)
+
+
+    async def sweep_chat(self,semaphore,voiceID,voiceChannel,chatChannel):
+        """
+        Adopts chatChannel for voiceChannel if the VC is occupied,
+        rebuilding its overwrites from who is in the VC now.
+        Otherwise the chat is released.
+        """
+        async with semaphore:
+            if voiceChannel is None:
+                await self.store.unlink(voiceID)
+                await self.pool.release(chatChannel)
+                return 'released'
+
+            async with self.get_channel_lock(voiceChannel.id):
+                current = self.charDict.get(voiceChannel.id)
+
+                # A chat may already have been made for someone who joined during the sweep
+                adopt = voiceChannel.members and (current is None or current.id == chatChannel.id)
+                if not adopt:
+                    if current is None:
+                        await self.store.unlink(voiceID)
+                else:
+                    await self.link_chat(voiceChannel,chatChannel)
+                    self.chatMembers[chatChannel.id] = {member.id : member for member in voiceChannel.members}
+                    # Empty, so the flush below writes everyone in the VC
+                    self.chatWritten[chatChannel.id] = frozenset()
+                    await self.flush_permissions(chatChannel)
+                    return 'adopted'
+
+            await self.pool.release(chatChannel)
+            return 'released'
+
+
+    async def link_chat(self,voiceChannel,chatChannel):
+        self.charDict[voiceChannel.id] = chatChannel
+        await self.store.link(voiceChannel.id,chatChannel.id)
+
+
+    async def unlink_chat(self,voiceID):
+        self.charDict.pop(voiceID,None)
+        await self.store.unlink(voiceID)
+
+
+    async def pool_loop(self):
+        while True:
+            for guild in self.bot.guilds:
+                try:
+                    await self.pool.maintain(guild)
+                except Exception:
+                    traceback.print_exc()
+            await asyncio.sleep(settings.CHAT_POOL_INTERVAL)
+    
     
     @commands.Cog.listener('on_voice_state_update')
     async def voice_status(self,member,previousState,newState):
         """
         Captures all voice channel leave/join/state-changes
         """
-        async with self.lock:
-            print('State Change caught')
+        # Mute, deafen, video etc. leave the member where they are,
+        # so there is nothing to do
+        if previousState.channel == newState.channel:
+            return
+        eventTime = time.perf_counter()
 
+        # Locks are always taken in ID order, so two members moving
+        # opposite ways between the same channels can't deadlock
+        channelIDs = sorted({state.channel.id for state in (previousState,newState) if state.channel is not None})
 
+        async with contextlib.AsyncExitStack() as stack:
+            for channelID in channelIDs:
+                await stack.enter_async_context(self.get_channel_lock(channelID))
 
+            print('State Change caught')
             print(previousState)        
             print(newState)
 
-            # Check if leaving all VC
-            if newState.channel == None:
+            if newState.channel is not None:
+                await self.join_voice(member,newState.channel,eventTime)
 
-                print('Left all VC')
-                await self.remove_member_from_chat(member,previousState)
-                await self.destroy_old_chat(member,previousState,newState)
-                print("Completed")
-                return 
+            if previousState.channel is not None:
+                await self.leave_voice(member,previousState.channel)
 
+            print("Completed")
 
-            # Check if first VC join
 
-            if previousState.channel == None:
+    async def join_voice(self,member,voiceChannel,eventTime):
+        """
+        A chat is only made once CHAT_CREATE_OCCUPANCY members are in
+        the VC, or someone has stayed for CHAT_CREATE_DWELL seconds, so
+        people hopping through channels don't cause a create each time
+        """
+        if voiceChannel.id in self.teardownQueue.pending:
+            print("Rejoined inside the grace period, keeping chat")
+            self.teardownQueue.discard(voiceChannel.id)
+            self.teardownsCancelled += 1
 
-                print('First VC join')
-                await self.create_new_chat(member,previousState,newState)
-                await self.add_member_to_chat(member,newState)
-                print("Completed")
-                return
+        if voiceChannel.id in self.charDict:
+            await self.add_member_to_chat(member,voiceChannel,eventTime)
 
-            if previousState.channel != newState.channel:
+        elif len(voiceChannel.members) >= settings.CHAT_CREATE_OCCUPANCY:
+            self.createQueue.discard(voiceChannel.id)
+            await self.create_new_chat(voiceChannel,eventTime)
 
-                await self.create_new_chat(member,previousState,newState)
-                await self.add_member_to_chat(member,newState)
-                await self.remove_member_from_chat(member,previousState)
-                await self.destroy_old_chat(member,previousState,newState)
-                print("Completed")
-                return
-            
-        
+        elif voiceChannel.id not in self.createQueue.pending:
+            async def create():
+                async with self.get_channel_lock(voiceChannel.id):
+                    if voiceChannel.members:
+                        await self.create_new_chat(voiceChannel,eventTime)
+
+            self.createQueue.schedule(voiceChannel.id,create)
+
+
+    async def leave_voice(self,member,voiceChannel):
+        """
+        Once a VC is empty its chat is kept for CHAT_TEARDOWN_GRACE
+        seconds in case someone comes back
+        """
+        if voiceChannel.id in self.charDict:
+            await self.remove_member_from_chat(member,voiceChannel)
+
+            if not voiceChannel.members:
+                async def teardown():
+                    async with self.get_channel_lock(voiceChannel.id):
+                        chatChannel = await self.destroy_old_chat(voiceChannel)
+                    # Wiping the chat takes a few calls, so the VC isn't kept locked for it
+                    if chatChannel is not None:
+                        await self.pool.release(chatChannel)
+                        print("Chat channel returned to the pool.")
+
+                self.teardownQueue.schedule(voiceChannel.id,teardown)
+
+        elif not voiceChannel.members and voiceChannel.id in self.createQueue.pending:
+            print("Left before the dwell time, no chat made")
+            self.createQueue.discard(voiceChannel.id)
+            self.createsSkipped += 1
+
+
+    def count_chat_call(self,kind):
+        """
+        Remembers when a chat was created or deleted, for chat_calls_per_hour
+        """
+        calls = self.chatCalls[kind]
+        calls.append(time.monotonic())
+        while calls[0] < calls[-1] - 3600:
+            calls.popleft()
+
+
+    def chat_calls_per_hour(self,kind):
+        calls = self.chatCalls[kind]
+        return sum(1 for called in calls if called >= time.monotonic() - 3600)
         
         
-    async def destroy_old_chat(self,member,previousState,newState):
+    async def destroy_old_chat(self,voiceChannel):
         """
         Checks if we need to destroy the old chat. This only occurs
-        when the old VC is empty.
+        when the old VC is empty. Returns the chat, now unlinked,
+        for the caller to release once the VC's lock is let go.
         """
         print("Destroy?")
         
         try:
-            if previousState.channel.id in self.charDict:
-
+            if voiceChannel.id in self.charDict:
 
-                print( previousState.channel.members)
-                if not previousState.channel.members:
 
+                print(voiceChannel.members)
+                if not voiceChannel.members:
 
-                    chatChannel = self.charDict.get(previousState.channel.id)
 
-                    await chatChannel.delete()
+                    chatChannel = self.charDict.get(voiceChannel.id)
 
-                    del self.charDict[previousState.channel.id]
-                    print("Chat channel deleted.")
+                    self.forget_chat(chatChannel)
+                    await self.unlink_chat(voiceChannel.id)
+                    self.count_chat_call('delete')
+                    return chatChannel
 
                 else:
                     print("Channel still occupied")
@@ -95,84 +339,153 @@ class ChatLinker(commands.Cog):
             print("Changing this permission is forbiden")
         except discord.errors.NotFound:
             print("Channel entry exists, but not found. Removing entry")
-            del self.charDict[previousState.channel.id]
+            await self.unlink_chat(voiceChannel.id)
 
         
         
         
         
-    async def create_new_chat(self,member,previousState,newState):
+    async def create_new_chat(self,voiceChannel,eventTime):
         
         """
         Checks if we need to create a new chat. This only occurs
-        if the new VC didn't have one.
+        if the VC doesn't have one. The chat is taken from the
+        pool and opened to everyone already in the VC in one edit.
         """
         print("Create?")
         
         try:
-            if newState.channel.id in self.charDict:
+            if voiceChannel.id in self.charDict:
 
                 print("Chat channel already exists.")
 
             else:
 
-                chatName = f'{newState.channel.name} chat'
+                chatName = f'{voiceChannel.name} chat'
+                members = list(voiceChannel.members)
 
-                overwrites = {
-                                newState.channel.guild.default_role: discord.PermissionOverwrite(read_messages=False),
-                                newState.channel.guild.me: discord.PermissionOverwrite(read_messages=True)
-                             }
-                chatChannel = await newState.channel.guild.create_text_channel(chatName,category=newState.channel.category, overwrites=overwrites)
+                chatChannel = await self.pool.acquire(voiceChannel.guild,chatName,voiceChannel.category,members)
+                self.joinLatency.record(time.perf_counter()-eventTime)
+                self.count_chat_call('create')
 
                 print(chatChannel.id)
 
-                self.charDict.update({newState.channel.id : chatChannel})
+                await self.link_chat(voiceChannel,chatChannel)
+                self.chatMembers[chatChannel.id] = {member.id : member for member in members}
+                self.chatWritten[chatChannel.id] = frozenset(self.chatMembers[chatChannel.id].keys())
 
                 print("Chat channel does not exist.")
         except discord.errors.Forbidden:
             print("Changing this permission is forbiden")
         except discord.errors.NotFound:
-            print("Channel entry exists, but not found. Removing entry")
-            del self.charDict[previousState.channel.id]   
+            print("Voice channel or its category has gone, no chat made")
             
             
             
             
             
             
-    async def add_member_to_chat(self,member,newState):
+    async def add_member_to_chat(self,member,voiceChannel,eventTime):
         """
         Adds member to the chat channel
         """
-        
-        try:
-            if newState.channel.id in self.charDict:
+        if voiceChannel.id in self.charDict:
 
-                chatChannel = self.charDict.get(newState.channel.id)
+            chatChannel = self.charDict.get(voiceChannel.id)
 
-                await chatChannel.set_permissions(member,read_messages=True)
+            if member.id not in self.chatWritten.get(chatChannel.id,()):
+                self.joinTimes.setdefault(chatChannel.id,{})[member.id] = eventTime
 
-        except discord.errors.Forbidden:
-            print("Changing this permission is forbiden")
-        except discord.errors.NotFound:
-            print("Channel entry exists, but not found. Removing entry")
-            del self.charDict[newState.channel.id] 
+            self.chatMembers.setdefault(chatChannel.id,{})[member.id] = member
+            self.queue_permissions(chatChannel)
             
             
-    async def remove_member_from_chat(self,member,previousState):
+    async def remove_member_from_chat(self,member,voiceChannel):
         """
         Removes member from the chat channel
         """
-        
-        try:
-            if previousState.channel.id in self.charDict:
+        if voiceChannel.id in self.charDict:
+
+            chatChannel = self.charDict.get(voiceChannel.id)
 
-                chatChannel = self.charDict.get(previousState.channel.id)
+            self.chatMembers.setdefault(chatChannel.id,{}).pop(member.id,None)
+            self.joinTimes.get(chatChannel.id,{}).pop(member.id,None)
+            self.queue_permissions(chatChannel)
 
-                await chatChannel.set_permissions(member,overwrite=None)
+
+    def forget_chat(self,chatChannel):
+        """
+        Drops the permission state of a chat channel that is going away
+        """
+        self.permissionQueue.discard(chatChannel.id)
+        self.chatMembers.pop(chatChannel.id,None)
+        self.chatWritten.pop(chatChannel.id,None)
+        self.joinTimes.pop(chatChannel.id,None)
+
+
+    def queue_permissions(self,chatChannel):
+        self.permissionRequests += 1
+
+        async def flush():
+            await self.flush_permissions(chatChannel)
+
+        self.permissionQueue.schedule(chatChannel.id,flush)
+
+
+    def chat_overwrites(self,chatChannel,members):
+        guild = chatChannel.guild
+        overwrites = {
+                        guild.default_role: discord.PermissionOverwrite(read_messages=False),
+                        guild.me: discord.PermissionOverwrite(read_messages=True)
+                     }
+        for member in members:
+            overwrites[member] = discord.PermissionOverwrite(read_messages=True)
+        return overwrites
+
+
+    async def flush_permissions(self,chatChannel):
+        """
+        Writes the net membership of a chat channel as one edit.
+        Nothing is sent if the members are the same as last written,
+        e.g. someone who joined and left again inside the window.
+        """
+        members = self.chatMembers.get(chatChannel.id)
+        if members is None:
+            return
+
+        memberIDs = frozenset(members.keys())
+        if memberIDs == self.chatWritten.get(chatChannel.id):
+            print(f"No net permission change for {chatChannel.name}")
+            return
+
+        try:
+            await chatChannel.edit(overwrites=self.chat_overwrites(chatChannel,list(members.values())))
+            self.chatWritten[chatChannel.id] = memberIDs
+            self.permissionEdits += 1
+            now = time.perf_counter()
+            for memberID, eventTime in self.joinTimes.pop(chatChannel.id,{}).items():
+                if memberID in memberIDs:
+                    self.joinLatency.record(now-eventTime)
+            print(f"Permissions: {self.permissionRequests} member changes sent as {self.permissionEdits} edits")
         except discord.errors.Forbidden:
             print("Changing this permission is forbiden")
         except discord.errors.NotFound:
             print("Channel entry exists, but not found. Removing entry")
-            del self.charDict[previousState.channel.id] 
-            
\ No newline at end of file
+            self.forget_chat(chatChannel)
+            for channelID, linked in list(self.charDict.items()):
+                if linked.id == chatChannel.id:
+                    await self.unlink_chat(channelID)
+
+
+    @commands.command(name='ps2-chat-stats')
+    @commands.has_any_role('CO','Captain','Lieutenant','Sergeant')
+    async def chat_stats(self,ctx):
+        """
+        Usage: !ps2-chat-stats
+        Shows the chat pool, chat churn and how long members waited to see their chat
+        """
+        await ctx.send(f'{self.pool.text()}\n'
+                       f'{self.lastSweep}\n'
+                       f'Last hour: {self.chat_calls_per_hour("create")} chats created, {self.chat_calls_per_hour("delete")} deleted\n'
+                       f'Avoided: {self.createsSkipped} creates (left before dwell time), {self.teardownsCancelled} deletes (rejoined in grace period)\n'
+                       f'Join to chat access: {self.joinLatency.text()}')
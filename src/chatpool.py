@@ -0,0 +1,183 @@
+import bisect
+import time
+import traceback
+from collections import OrderedDict
+
+import discord
+
+from discordbasics import rest_call
+
+
+# Discord epoch, for reading a message's age from its ID
+DISCORD_EPOCH = 1420070400000
+
+# Only messages younger than 14 days can be bulk deleted, less an hour to be safe
+BULK_DELETE_AGE = 14*24*3600 - 3600
+
+
+def message_age(message):
+    return time.time() - ((message.id >> 22) + DISCORD_EPOCH)/1000
+
+
+class LatencyHistogram():
+    """
+    Counts durations into fixed buckets (in seconds)
+    """
+    def __init__(self,buckets=(0.1,0.25,0.5,1,2,5,10)):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets)+1)
+
+    def record(self,seconds):
+        self.counts[bisect.bisect_left(self.buckets,seconds)] += 1
+
+    def text(self):
+        labels = [f'<={bucket}s' for bucket in self.buckets] + [f'>{self.buckets[-1]}s']
+        return ', '.join(f'{label}: {count}' for label, count in zip(labels,self.counts))
+
+
+class ChatPool():
+    """
+    Keeps hidden text channels ready to hand out as linked chats, so
+    the first person into a voice channel gets a chat with one edit
+    (name, category and overwrites) instead of waiting for a create.
+
+    Released chats are wiped and hidden again, then kept for reuse,
+    as long as they have at most recycleLimit messages that can all be
+    bulk deleted. Otherwise they are deleted. The pool is topped up to
+    minSize, holds at most maxSize spares, and spares idle for longer
+    than idleTimeout seconds are deleted down to minSize by maintain().
+
+    Every REST call goes through budget (a ratelimit.RateBudget).
+    """
+    POOL_NAME = 'spare-chat'
+
+    def __init__(self,minSize,maxSize,idleTimeout,recycleLimit,budget):
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.idleTimeout = idleTimeout
+        # A bulk delete takes at most 100 messages
+        self.recycleLimit = min(recycleLimit,100)
+        self.budget = budget
+        self.spares = {} # {guild_id : OrderedDict {channel_id : [channel, idle since]}}
+        self.hits = 0
+        self.misses = 0
+
+
+    def hidden_overwrites(guild):
+        return {
+                    guild.default_role: discord.PermissionOverwrite(read_messages=False),
+                    guild.me: discord.PermissionOverwrite(read_messages=True)
+               }
+
+
+    def made_by_bot(channel):
+        """
+        Whether channel carries the overwrites the bot gives its chats:
+        hidden from everyone, readable by the bot
+        """
+        guild = channel.guild
+        return (channel.overwrites_for(guild.default_role).read_messages is False and
+                channel.overwrites_for(guild.me).read_messages is True)
+
+
+    def guild_spares(self,guild):
+        return self.spares.setdefault(guild.id,OrderedDict())
+
+
+    def adopt(self,channel):
+        """
+        Takes an existing spare channel, e.g. one left from before a restart
+        """
+        self.guild_spares(channel.guild)[channel.id] = [channel,time.monotonic()]
+
+
+    async def acquire(self,guild,name,category,members):
+        """
+        Returns a chat channel called name in category, visible to
+        members. A spare is reused if there is one.
+        """
+        overwrites = ChatPool.hidden_overwrites(guild)
+        for member in members:
+            overwrites[member] = discord.PermissionOverwrite(read_messages=True)
+
+        spares = self.guild_spares(guild)
+        while spares:
+            channelID, (channel, idleSince) = spares.popitem(last=False)
+            try:
+                await rest_call(self.budget,channel.edit,name=name,category=category,overwrites=overwrites)
+            except discord.errors.NotFound:
+                print(f'Spare chat {channelID} has gone, trying the next')
+                continue
+            self.hits += 1
+            return channel
+
+        self.misses += 1
+        return await rest_call(self.budget,guild.create_text_channel,name,category=category,overwrites=overwrites)
+
+
+    async def recent_messages(self,channel):
+        return [message async for message in channel.history(limit=self.recycleLimit+1)]
+
+
+    async def release(self,channel):
+        """
+        Wipes and hides a chat channel and keeps it as a spare. It is
+        deleted instead if the pool is full, or if wiping it would take
+        more than one bulk delete. Don't hold a voice channel lock
+        while calling this.
+        """
+        spares = self.guild_spares(channel.guild)
+        try:
+            if len(spares) >= self.maxSize:
+                await rest_call(self.budget,channel.delete)
+                return
+
+            messages = []
+            if channel.last_message_id is not None:
+                messages = await rest_call(self.budget,self.recent_messages,channel)
+            if len(messages) > self.recycleLimit or any(message_age(message) > BULK_DELETE_AGE for message in messages):
+                print(f'{channel.name} has too much history to wipe, deleting it')
+                await rest_call(self.budget,channel.delete)
+                return
+
+            if messages:
+                await rest_call(self.budget,channel.delete_messages,messages)
+            await rest_call(self.budget,channel.edit,name=ChatPool.POOL_NAME,category=None,overwrites=ChatPool.hidden_overwrites(channel.guild))
+        except discord.errors.NotFound:
+            return
+        except discord.errors.HTTPException:
+            traceback.print_exc()
+            print(f'Could not wipe {channel.name}, deleting it')
+            try:
+                await rest_call(self.budget,channel.delete)
+            except discord.errors.HTTPException:
+                traceback.print_exc()
+            return
+        spares[channel.id] = [channel,time.monotonic()]
+
+
+    async def maintain(self,guild):
+        """
+        Deletes spares idle past idleTimeout (keeping minSize)
+        and creates spares up to minSize
+        """
+        spares = self.guild_spares(guild)
+        now = time.monotonic()
+        for channelID, (channel, idleSince) in list(spares.items()):
+            if len(spares) <= self.minSize:
+                break
+            # An acquire may have taken it while an earlier delete was awaited
+            if now - idleSince > self.idleTimeout and spares.pop(channelID,None) is not None:
+                try:
+                    await rest_call(self.budget,channel.delete)
+                except discord.errors.NotFound:
+                    pass
+
+        while len(spares) < self.minSize:
+            channel = await rest_call(self.budget,guild.create_text_channel,ChatPool.POOL_NAME,overwrites=ChatPool.hidden_overwrites(guild))
+            spares[channel.id] = [channel,time.monotonic()]
+
+
+    def text(self):
+        spares = sum(len(spares) for spares in self.spares.values())
+        return f'Chat pool: {spares} spare, {self.hits} reused, {self.misses} created'
@@ -0,0 +1,73 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ChatStore():
+    """
+    Keeps the voice channel -> chat channel links on disk, so
+    ChatLinker can pick its chats back up after a restart.
+
+    Links change only when a chat is made or released, so each
+    change is written straight away on a single worker thread.
+    """
+    def __init__(self,path):
+        self.path = path
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+
+    def open_database(self):
+        """
+        Runs on the worker thread
+        """
+        self.connection = sqlite3.connect(self.path,check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS chats (voice_id INTEGER PRIMARY KEY, chat_id INTEGER NOT NULL)')
+        self.connection.commit()
+
+
+    async def run(self,function,*args):
+        return await asyncio.get_event_loop().run_in_executor(self.executor,function,*args)
+
+
+    async def start(self):
+        if self.connection is None:
+            await self.run(self.open_database)
+
+
+    async def close(self):
+        if self.connection is not None:
+            await self.run(self.connection.close)
+            self.connection = None
+
+
+    def write_link(self,voiceID,chatID):
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO chats (voice_id, chat_id) VALUES (?,?)',(voiceID,chatID))
+
+
+    def write_unlink(self,voiceID):
+        with self.connection:
+            self.connection.execute('DELETE FROM chats WHERE voice_id = ?',(voiceID,))
+
+
+    def read_links(self):
+        return dict(self.connection.execute('SELECT voice_id, chat_id FROM chats'))
+
+
+    async def link(self,voiceID,chatID):
+        if self.connection is not None:
+            await self.run(self.write_link,voiceID,chatID)
+
+
+    async def unlink(self,voiceID):
+        if self.connection is not None:
+            await self.run(self.write_unlink,voiceID)
+
+
+    async def load(self):
+        """
+        Returns {voice_id : chat_id}
+        """
+        return await self.run(self.read_links)
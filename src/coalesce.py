@@ -0,0 +1,68 @@
+import asyncio
+import traceback
+
+
+class CoalescingQueue():
+    """
+    Merges repeated requests for the same key into a single call.
+
+    The first request for a key starts a timer of `window` seconds.
+    Requests made while the timer is running replace the pending callback,
+    so when the window closes only the most recent one is run.
+    """
+    def __init__(self,window):
+        self.window = window
+        self.pending = {} # {key : [callback, task]}
+
+
+    def schedule(self,key,callback):
+        """
+        Queue callback (a coroutine function taking no arguments)
+        to run once the window for key closes
+        """
+        if key in self.pending:
+            self.pending[key][0] = callback
+            return
+
+        task = asyncio.get_event_loop().create_task(self.wait_and_run(key))
+        self.pending[key] = [callback,task]
+
+
+    async def wait_and_run(self,key):
+        await asyncio.sleep(self.window)
+        await self.run(key)
+
+
+    async def run(self,key):
+        entry = self.pending.pop(key,None)
+        if entry is None:
+            return
+        try:
+            await entry[0]()
+        except Exception:
+            traceback.print_exc()
+
+
+    async def flush(self,key):
+        """
+        Run the pending callback for key now, rather than
+        waiting for the window to close
+        """
+        entry = self.pending.get(key)
+        if entry is not None:
+            entry[1].cancel()
+            await self.run(key)
+
+
+    async def flush_all(self):
+        for key in list(self.pending.keys()):
+            await self.flush(key)
+
+
+    def discard(self,key):
+        """
+        Drop the pending callback for key without running it
+        """
+        entry = self.pending.pop(key,None)
+        if entry is not None:
+            entry[1].cancel()
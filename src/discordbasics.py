@@ -2,6 +2,15 @@ import discord
 import settings
 import traceback
 
+async def rest_call(budget,function,*args,**kwargs):
+    """
+    Runs a REST call inside budget (a ratelimit.RateBudget), if given
+    """
+    if budget is None:
+        return await function(*args,**kwargs)
+    return await budget.call(function,*args,**kwargs)
+
+
 class channelManipulation():
     
     def __init__(self):
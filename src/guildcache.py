@@ -0,0 +1,164 @@
+import discord
+from discord.ext import commands
+
+
+class GuildCache(commands.Cog):
+    """
+    Keeps an index of the roles, text channels and categories of each
+    guild by name. The index is kept current from the gateway create,
+    update and delete events, so looking something up by name is a
+    dictionary hit rather than a REST call or a scan of the guild.
+    """
+    def __init__(self,bot):
+        self.bot = bot
+        self.indexes = {} # {guild_id : {kind : {name : object}}}
+        self.hits = 0
+        self.misses = 0
+        super().__init__()
+
+
+    def build_index(self,guild):
+        index = {'roles':{}, 'text':{}, 'categories':{}}
+        for role in guild.roles:
+            index['roles'].setdefault(role.name,role)
+        for channel in guild.channels:
+            kind = GuildCache.channel_kind(channel)
+            if kind is not None:
+                index[kind].setdefault(channel.name,channel)
+        self.indexes[guild.id] = index
+        return index
+
+
+    def channel_kind(channel):
+        if isinstance(channel,discord.TextChannel):
+            return 'text'
+        if isinstance(channel,discord.CategoryChannel):
+            return 'categories'
+        return None
+
+
+    def index(self,guild,kind):
+        index = self.indexes.get(guild.id)
+        if index is None:
+            index = self.build_index(guild)
+        return index[kind]
+
+
+    def lookup(self,guild,kind,name):
+        found = self.index(guild,kind).get(name)
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+
+    def role(self,guild,name):
+        return self.lookup(guild,'roles',name)
+
+    def roles(self,guild,words):
+        """
+        Finds the roles named by words typed into a command, where a
+        name can itself hold spaces. The longest run of words that names
+        a role wins, so 'Guest SL' is found before 'Guest'. Counts one
+        hit or miss per role, not per run tried.
+        """
+        roles = self.index(guild,'roles')
+        longest = max((name.count(' ')+1 for name in roles),default=1)
+        found = []
+        start = 0
+        while start < len(words):
+            role = None
+            for end in range(min(len(words),start+longest),start,-1):
+                role = roles.get(' '.join(words[start:end]))
+                if role is not None:
+                    break
+            if role is None:
+                self.misses += 1
+                start += 1
+            else:
+                self.hits += 1
+                found.append(role)
+                start = end
+        return found
+
+    def text_channel(self,guild,name):
+        return self.lookup(guild,'text',name)
+
+    def category(self,guild,name):
+        return self.lookup(guild,'categories',name)
+
+
+    def add_entry(self,guild,kind,obj):
+        index = self.indexes.get(guild.id)
+        if index is not None and kind is not None:
+            index[kind].setdefault(obj.name,obj)
+
+
+    def remove_entry(self,guild,kind,obj,name):
+        """
+        Removes obj from the index under name. If another object
+        of the same kind shares the name, it takes its place.
+        """
+        index = self.indexes.get(guild.id)
+        if index is None or kind is None:
+            return
+        if name in index[kind] and index[kind][name].id == obj.id:
+            del index[kind][name]
+            candidates = guild.roles if kind == 'roles' else guild.channels
+            for other in candidates:
+                if other.id != obj.id and other.name == name and (kind == 'roles' or GuildCache.channel_kind(other) == kind):
+                    index[kind][name] = other
+                    break
+
+
+    @commands.Cog.listener('on_ready')
+    async def index_guilds(self):
+        for guild in self.bot.guilds:
+            self.build_index(guild)
+
+    @commands.Cog.listener('on_guild_join')
+    async def index_new_guild(self,guild):
+        self.build_index(guild)
+
+    @commands.Cog.listener('on_guild_remove')
+    async def forget_guild(self,guild):
+        self.indexes.pop(guild.id,None)
+
+
+    @commands.Cog.listener('on_guild_role_create')
+    async def role_created(self,role):
+        self.add_entry(role.guild,'roles',role)
+
+    @commands.Cog.listener('on_guild_role_update')
+    async def role_updated(self,before,after):
+        self.remove_entry(after.guild,'roles',after,before.name)
+        self.add_entry(after.guild,'roles',after)
+
+    @commands.Cog.listener('on_guild_role_delete')
+    async def role_deleted(self,role):
+        self.remove_entry(role.guild,'roles',role,role.name)
+
+
+    @commands.Cog.listener('on_guild_channel_create')
+    async def channel_created(self,channel):
+        self.add_entry(channel.guild,GuildCache.channel_kind(channel),channel)
+
+    @commands.Cog.listener('on_guild_channel_update')
+    async def channel_updated(self,before,after):
+        self.remove_entry(after.guild,GuildCache.channel_kind(before),after,before.name)
+        self.add_entry(after.guild,GuildCache.channel_kind(after),after)
+
+    @commands.Cog.listener('on_guild_channel_delete')
+    async def channel_deleted(self,channel):
+        self.remove_entry(channel.guild,GuildCache.channel_kind(channel),channel,channel.name)
+
+
+    @commands.command(name='ps2-cache-stats')
+    @commands.has_any_role('CO','Captain','Lieutenant','Sergeant')
+    async def cache_stats(self,ctx):
+        """
+        Usage: !ps2-cache-stats
+        Shows how often role and channel lookups were answered from the cache
+        """
+        await ctx.send(f'Guild cache: {self.hits} hits, {self.misses} misses')
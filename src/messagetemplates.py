@@ -0,0 +1,90 @@
+import asyncio
+import os
+import string
+import traceback
+
+
+MESSAGE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),'messages')
+
+
+class TemplateCache():
+    """
+    Holds every message template in the messages directory in memory,
+    keyed by file name without the extension (messages/soberdogs.txt
+    is 'soberdogs').
+
+    Everything is read once at import. After start() is called, the
+    directory is checked in the background and any file whose mtime
+    has changed is read again, on a worker thread.
+
+    Templates may use $date and $opsType, which are filled in when
+    the sheet is posted.
+    """
+    def __init__(self,directory):
+        self.directory = directory
+        self.templates = {} # {name : text}
+        self.mtimes = {}    # {name : mtime}
+        self.reloadTask = None
+        self.apply_changes(self.read_changes())
+
+
+    def read_changes(self):
+        """
+        Reads every template that is new or changed since the last load.
+        Returns ({name : (mtime, text)}, [removed names])
+        """
+        changed = {}
+        seen = set()
+        for fileName in os.listdir(self.directory):
+            name, extension = os.path.splitext(fileName)
+            if extension != '.txt':
+                continue
+            seen.add(name)
+            path = os.path.join(self.directory,fileName)
+            mtime = os.stat(path).st_mtime
+            if self.mtimes.get(name) != mtime:
+                with open(path,'r') as f:
+                    changed[name] = (mtime,f.read())
+        removed = [name for name in self.templates if name not in seen]
+        return changed, removed
+
+
+    def apply_changes(self,changes):
+        changed, removed = changes
+        for name, (mtime, text) in changed.items():
+            self.templates[name] = text
+            self.mtimes[name] = mtime
+        for name in removed:
+            del self.templates[name]
+            del self.mtimes[name]
+        return changed, removed
+
+
+    def get(self,name):
+        return self.templates[name]
+
+
+    def render(text,**values):
+        return string.Template(text).safe_substitute(values)
+
+
+    def start(self,interval):
+        if self.reloadTask is None:
+            self.reloadTask = asyncio.get_event_loop().create_task(self.reload_loop(interval))
+
+
+    async def reload_loop(self,interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changes = await asyncio.get_event_loop().run_in_executor(None,self.read_changes)
+                changed, removed = self.apply_changes(changes)
+                for name in changed:
+                    print(f'Reloaded message template {name}')
+                for name in removed:
+                    print(f'Removed message template {name}')
+            except Exception:
+                traceback.print_exc()
+
+
+templates = TemplateCache(MESSAGE_DIRECTORY)
@@ -2,6 +2,9 @@ import os
 import asyncio
 import discord
 import random
+import shlex
+import time
+import weakref
 
 import settings
 
@@ -10,6 +13,10 @@ from discord.ext import commands
 from dotenv import load_dotenv
 
 from opsignupclasses import *
+from coalesce import CoalescingQueue
+from signupstore import SignUpStore
+from messagetemplates import templates
+from signupviews import COMPONENTS_AVAILABLE, LEAVE_KEY, build_sign_up_view, sign_up_key
 
 
 getFuckedGifRotation = ["https://tenor.com/view/sosiska-gif-23857394",
@@ -45,6 +52,26 @@ getFuckedTextRotation = ["you little shit",
 
 
 
+def plan_ping_messages(header,userIDs,limit=2000):
+    """
+    Packs a mention for each user ID into as few messages as
+    possible, each no longer than limit characters.
+    The header starts the first message.
+    """
+    messages = []
+    current = header
+    for userID in userIDs:
+        mention = f'<@{userID}>'
+        if len(current) + len(mention) + 1 > limit:
+            messages.append(current)
+            current = mention
+        elif current:
+            current = current + ' ' + mention
+        else:
+            current = mention
+    if current:
+        messages.append(current)
+    return messages
 
 
 class OpSignUp(commands.Cog):
@@ -52,19 +79,324 @@ class OpSignUp(commands.Cog):
     Class to generate automated signup sheets
     """
     def __init__(self,bot):
-        self.signUpChannelName = {'soberdogs':['✍-soberdogs',SoberDogs],'armourdogs':['✍-armourdogs',ArmourDogs],
-                                  'bastion':['✍-bastion',Bastion],'squadleaders':['✍-squadleaders',SquadLead],
-                                  'dogfighters':['✍-dogfighters',DogFighters],'logidogs':['✍-logistics', Logidogs],
-                                  'training':['✍-live-exercises',Training], 'jointops':['✍-joint-ops',JointOps],
-                                  'raw':['✍-royal-air-woof', RoyalAirWoof],'ncaf':['✍-ncaf',NCAF],
-                                  'cobaltclash':['✍-cobalt-clash',CobaltClash], 'outfitwars':['✍-outfit-wars',OutfitWars]}
+        # Loaded from signuptypes.json, see opsignupclasses.load_signup_types
+        self.signUpTypes = signUpTypes
 
         self.objDict = {}
         self.bot = bot
+
+        # Guild wide lock, only held while objDict itself is changed.
+        # Work on a single sheet is serialised by its own lock in signUpLocks
         self.lock = asyncio.Lock()
+        # Weak, so a lock goes away by itself once nothing holds or waits
+        # on it. Removing it by hand could hand a second lock to an event
+        # that arrives while the first is still held.
+        self.signUpLocks = weakref.WeakValueDictionary() # {message_id : asyncio.Lock}
+
+        # Embed edits are merged per message so a burst of reactions
+        # only costs one message.edit
+        self.renderQueue = CoalescingQueue(settings.SIGNUP_RENDER_WINDOW)
+
+        self.store = SignUpStore(settings.SIGNUP_DB,settings.SIGNUP_FLUSH_INTERVAL)
+        self.restored = False
+
+        self.transport = settings.SIGNUP_TRANSPORT
+        if self.transport != 'reactions' and not COMPONENTS_AVAILABLE:
+            print(f'Signup {self.transport} need discord.py 2.0, using reactions')
+            self.transport = 'reactions'
+
+        # REST calls and accepted signup changes, counted under the
+        # transport of the sheet they were for, see !ps2-signup-stats
+        self.restCalls = {'reactions':0,'buttons':0,'both':0}
+        self.signUpChanges = {'reactions':0,'buttons':0,'both':0}
+
+        # Sheets moved out of objDict into the store's archive,
+        # {message_id : (signup type, date)}
+        self.archivedIDs = {}
+
+        # Held while a sheet is looked for and posted, so the same
+        # sheet can't be posted twice by commands running at once
+        self.postLocks = weakref.WeakValueDictionary() # {(signup type, date) : asyncio.Lock}
+        self.archiveTask = None
         super().__init__()
 
 
+    def get_sign_up_lock(self,messageID):
+        """
+        Returns the lock for a single signup sheet, creating
+        it the first time the sheet is touched
+        """
+        lock = self.signUpLocks.get(messageID)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.signUpLocks[messageID] = lock
+        return lock
+
+
+    def get_post_lock(self,signup,date):
+        """
+        Returns the lock for posting a sheet of this type and date
+        """
+        lock = self.postLocks.get((signup,date))
+        if lock is None:
+            lock = asyncio.Lock()
+            self.postLocks[(signup,date)] = lock
+        return lock
+
+
+    def posted_sign_up(self,signup,date):
+        """
+        Returns the message ID of a live or archived sheet
+        of this type and date, or None
+        """
+        for obj in list(self.objDict.values()):
+            if obj.signUpType == signup and obj.date == date:
+                return obj.messageHandlerID
+        for messageID, key in self.archivedIDs.items():
+            if key == (signup,date):
+                return messageID
+        return None
+
+
+    async def get_sign_up(self,messageID):
+        """
+        Returns the sheet for messageID, reading it back from the
+        archive if it has been archived. Returns None if there is
+        no such sheet.
+
+        The caller should hold the lock for the sheet.
+        """
+        obj = self.objDict.get(messageID)
+        if obj is not None or messageID not in self.archivedIDs:
+            return obj
+
+        state = await self.store.unarchive(messageID)
+        self.archivedIDs.pop(messageID,None)
+        if state is None:
+            return None
+
+        obj = SignUpSheet.from_state(state)
+        async with self.lock:
+            self.objDict[messageID] = obj
+        self.store.save(obj)
+        print(f'Signup {messageID} read back from the archive')
+        return obj
+
+
+    async def archive_loop(self):
+        while True:
+            await asyncio.sleep(settings.SIGNUP_ARCHIVE_INTERVAL)
+            try:
+                await self.archive_sign_ups()
+            except Exception:
+                traceback.print_exc()
+
+
+    async def archive_sign_ups(self):
+        """
+        Moves every sheet that is past its start time, plus
+        SIGNUP_ARCHIVE_GRACE, out of objDict and into the archive
+        """
+        now = time.time()
+        expired = [obj for obj in list(self.objDict.values())
+                   if obj.expiry_time(settings.SIGNUP_ARCHIVE_GRACE,settings.SIGNUP_MAX_AGE) < now]
+
+        for obj in expired:
+            async with self.get_sign_up_lock(obj.messageHandlerID):
+                if self.objDict.get(obj.messageHandlerID) is not obj:
+                    continue
+                await self.renderQueue.flush(obj.messageHandlerID)
+                self.store.archive(obj)
+                self.archivedIDs[obj.messageHandlerID] = (obj.signUpType,obj.date)
+                async with self.lock:
+                    del self.objDict[obj.messageHandlerID]
+
+        if expired:
+            print(f'Archived {len(expired)} signups, {len(self.objDict)} still live')
+
+
+    async def shutdown(self):
+        """
+        Publishes any embed updates still waiting in the render queue
+        """
+        if self.archiveTask is not None:
+            self.archiveTask.cancel()
+        await self.renderQueue.flush_all()
+        await self.store.close()
+
+
+    @commands.Cog.listener('on_ready')
+    async def start_template_reload(self):
+        templates.start(settings.TEMPLATE_RELOAD_INTERVAL)
+
+
+    @commands.Cog.listener('on_ready')
+    async def restore_sign_ups(self):
+        """
+        Rebuilds objDict from the signup store, replaying
+        any journal entries written after each snapshot.
+
+        Only runs on the first ready event, not on reconnects.
+        """
+        if self.restored:
+            return
+        self.restored = True
+
+        startTime = time.perf_counter()
+        try:
+            await self.store.start()
+            sheets = await self.store.load()
+            self.archivedIDs = await self.store.archived()
+        except Exception:
+            traceback.print_exc()
+            print('Signup restore failed')
+            return
+
+        restored = {}
+        for messageID, (state, journal) in sheets.items():
+            try:
+                obj = SignUpSheet.from_state(state)
+                for event in journal:
+                    obj.apply_event(event)
+            except Exception:
+                traceback.print_exc()
+                print(f'Could not restore signup {messageID}')
+            else:
+                restored[messageID] = obj
+
+        async with self.lock:
+            self.objDict.update(restored)
+        print(f'Restored {len(restored)} signups in {time.perf_counter()-startTime:.3f}s, {len(self.archivedIDs)} archived')
+
+        await self.reconcile_sign_ups()
+
+        self.archiveTask = asyncio.get_event_loop().create_task(self.archive_loop())
+
+
+    async def reconcile_sign_ups(self):
+        """
+        Brings every sheet in objDict back in line with the reactions
+        that are actually on its message, catching anything that
+        happened while the bot was offline.
+
+        Sheets are checked concurrently, with at most
+        SIGNUP_RECONCILE_CONCURRENCY in flight at once.
+        """
+        startTime = time.perf_counter()
+        semaphore = asyncio.Semaphore(settings.SIGNUP_RECONCILE_CONCURRENCY)
+
+        # Work through one signup channel at a time in turn, so a busy
+        # channel does not hog every slot in the semaphore
+        channels = {}
+        for obj in list(self.objDict.values()):
+            channels.setdefault(obj.signUpChannelID,[]).append(obj)
+        ordered = []
+        while channels:
+            for channelID in list(channels.keys()):
+                ordered.append(channels[channelID].pop())
+                if not channels[channelID]:
+                    del channels[channelID]
+
+        totals = {'checked':0,'changed':0,'missing':0,'failed':0,'added':0,'removed':0}
+
+        async def reconcile(obj):
+            async with semaphore:
+                try:
+                    result = await OpSignUp.reconcile_sign_up(self,obj)
+                except Exception:
+                    traceback.print_exc()
+                    result = {'failed':1}
+            for key, value in result.items():
+                totals[key] += value
+            totals['checked'] += 1
+            if totals['checked'] % 25 == 0:
+                print(f"Reconciled {totals['checked']}/{len(ordered)} signups")
+
+        await asyncio.gather(*[reconcile(obj) for obj in ordered])
+
+        print(f"Reconciled {totals['checked']} signups in {time.perf_counter()-startTime:.3f}s: "
+              f"{totals['changed']} changed ({totals['added']} added, {totals['removed']} removed), "
+              f"{totals['missing']} messages gone, {totals['failed']} failed")
+
+
+    async def reconcile_sign_up(self,obj):
+        """
+        Reads the reactions on one signup message and applies the
+        difference to its ReactionData, then re-renders it once.
+
+        The sheet's lock is held from before the reactions are read
+        until the difference is applied, so a live add or remove can't
+        land in between and be undone by a stale read.
+
+        Button signups have no reaction behind them, so sheets with
+        buttons are never trimmed to their reactions. Button-only
+        sheets are left alone, and sheets with both only pick up
+        reactions added while we were offline.
+        """
+        async with self.get_sign_up_lock(obj.messageHandlerID):
+            if self.objDict.get(obj.messageHandlerID) is not obj:
+                return {}
+
+            channel = self.bot.get_channel(obj.signUpChannelID)
+            message = None
+            if channel is not None:
+                try:
+                    message = await channel.fetch_message(obj.messageHandlerID)
+                except discord.errors.NotFound:
+                    pass
+
+            if message is None:
+                print(f'Signup message {obj.messageHandlerID} no longer exists')
+                async with self.lock:
+                    self.objDict.pop(obj.messageHandlerID,None)
+                self.store.delete(obj.messageHandlerID)
+                return {'missing':1}
+
+            if obj.transport == 'buttons':
+                return {}
+
+            # {userID : [mention, [emoji, ...]]} in the order the reactions appear
+            reacted = {}
+            for reaction in message.reactions:
+                emoji = str(reaction.emoji)
+                if emoji not in obj.reactions:
+                    continue
+                async for user in reaction.users():
+                    if user.id == self.bot.user.id:
+                        continue
+                    reacted.setdefault(str(user.id),[user.mention,[]])[1].append(emoji)
+
+            added = 0
+            removed = 0
+            for userID, emoji in list(obj.memberIndex.items()):
+                if obj.transport != 'reactions':
+                    break
+                if userID not in reacted or emoji not in reacted[userID][1]:
+                    obj.remove_signup(userID,emoji)
+                    OpSignUp.update_data_entry(self,obj,'remove',{'user':userID,'emoji':emoji})
+                    removed += 1
+
+            for userID, (mention, emojis) in reacted.items():
+                if obj.signed_up_to(userID) is not None:
+                    continue
+                # Prefer a reaction with room over joining a waitlist
+                emojis = sorted(emojis,key=lambda emoji: obj.reactions[emoji].is_full())
+                for emoji in emojis:
+                    if obj.add_signup(userID,emoji,f'{mention}\n') is not None:
+                        OpSignUp.update_data_entry(self,obj,'add',{'user':userID,'emoji':emoji,'text':f'{mention}\n'})
+                        added += 1
+                        break
+
+            if added or removed:
+                obj.messageHandle = message
+                OpSignUp.queue_update_embed(self,obj)
+
+        if added or removed:
+            await self.renderQueue.flush(obj.messageHandlerID)
+            return {'changed':1,'added':added,'removed':removed}
+        return {}
+
+
     @commands.Cog.listener('on_raw_reaction_remove')
     async def react_remove_sign_up_check(self,payload):
         """
@@ -78,11 +410,13 @@ class OpSignUp(commands.Cog):
         if payload.user_id == self.bot.user.id:
             print('Passing bot reacts')
             pass
-        elif payload.message_id in self.objDict:
+        elif payload.message_id in self.objDict or payload.message_id in self.archivedIDs:
             print('Remove react')
-            async with self.lock:
-                obj = self.objDict[payload.message_id]
-                await OpSignUp.generic_react_remove(self,obj,payload)
+            async with self.get_sign_up_lock(payload.message_id):
+                obj = await OpSignUp.get_sign_up(self,payload.message_id)
+                if obj is not None:
+                    obj.lastActive = time.time()
+                    await OpSignUp.generic_react_remove(self,obj,payload)
         else:
             pass
 
@@ -101,11 +435,13 @@ class OpSignUp(commands.Cog):
         if payload.user_id == 797809584604446740:
             print('Passing bot reacts')
             pass
-        elif payload.message_id in self.objDict:
+        elif payload.message_id in self.objDict or payload.message_id in self.archivedIDs:
             print('Add react')
-            async with self.lock:
-                obj = self.objDict[payload.message_id]
-                await OpSignUp.generic_react_add(self,obj,payload)
+            async with self.get_sign_up_lock(payload.message_id):
+                obj = await OpSignUp.get_sign_up(self,payload.message_id)
+                if obj is not None:
+                    obj.lastActive = time.time()
+                    await OpSignUp.generic_react_add(self,obj,payload)
         else:
             pass
 
@@ -121,9 +457,12 @@ class OpSignUp(commands.Cog):
 
         Function then cleans up the objects
         """
-        if payload.message_id in self.objDict:
+        if payload.message_id in self.objDict or payload.message_id in self.archivedIDs:
             async with self.lock:
-                del self.objDict[payload.message_id]
+                self.objDict.pop(payload.message_id,None)
+            self.archivedIDs.pop(payload.message_id,None)
+            self.renderQueue.discard(payload.message_id)
+            self.store.delete(payload.message_id)
             print('Message Deleted')
         else:
             pass
@@ -142,6 +481,7 @@ class OpSignUp(commands.Cog):
         squadtype-1: squadleaders, soberdogs, armourdogs, dogfighters
                     bastion, raw
         squadtype-2: training, ncaf, cobaltclash
+        Squad types are defined in signuptypes.json
         limit-type: current-limits, set-limits
 
         date: Type as a string within quotation marks, e.g "Monday 8:30"
@@ -171,58 +511,150 @@ class OpSignUp(commands.Cog):
         dictionary of form {message_id : squadObj}
         """
 
-        async with self.lock:
-            if signup in self.signUpChannelName:
-                channel = await OpSignUp.locate_sign_up(self,ctx,signup)
-                print('Sign up found')
-                try:
-                    obj=self.signUpChannelName[signup][1](channel,*args)
-                except Exception:
-                    traceback.print_exc()
-                    print('Sign up failed')
-                else:
-                    print(f'{signup} instantiated')
-                    await obj.send_message(ctx,date)
-                    print(f'{signup} message sent {obj.messageHandlerID}')
-                    self.objDict.update( {obj.messageHandlerID : obj})
-                    print(f'{signup} added to dictionary')
-
-            elif signup == 'current-limits':
-                try:
-                    obj = self.objDict[int(date)]
-                    print(obj)
-                    print(obj.messageHandlerID)
-                    await obj.get_reaction_details(ctx)
-
-                except Exception:
-                    traceback.print_exc()
-                    print("Object does not exist")
-                    print(self.objDict)
+        if signup in self.signUpTypes:
+            try:
+                async with self.get_post_lock(signup,date):
+                    await OpSignUp.post_sign_up(self,ctx,signup,date,*args)
+            except Exception:
+                traceback.print_exc()
+                print('Sign up failed')
 
-            elif signup == 'set-limits':
-                try:
-                    obj = self.objDict[int(date)]
+        elif signup == 'current-limits':
+            try:
+                async with self.get_sign_up_lock(int(date)):
+                    obj = await OpSignUp.get_sign_up(self,int(date))
+                print(obj)
+                print(obj.messageHandlerID)
+                await obj.get_reaction_details(ctx)
+
+            except Exception:
+                traceback.print_exc()
+                print("Object does not exist")
+                print(self.objDict)
+
+        elif signup == 'set-limits':
+            try:
+                async with self.get_sign_up_lock(int(date)):
+                    obj = await OpSignUp.get_sign_up(self,int(date))
                     print(obj)
                     print(obj.messageHandlerID)
-                    await obj.set_reaction_details(ctx,*args)
+                    changes = await obj.set_reaction_details(ctx,*args)
+                    for reaction, maxReact in changes.items():
+                        OpSignUp.update_data_entry(self,obj,'limit',{'emoji':reaction,'max':maxReact})
+                    if changes:
+                        OpSignUp.queue_update_embed(self,obj)
 
-                except Exception:
-                    traceback.print_exc()
-                    print("Object does not exist")
-                    print(self.objDict)
+            except Exception:
+                traceback.print_exc()
+                print("Object does not exist")
+                print(self.objDict)
 
-            else:
-                print('Sign up type does not exist')
+        else:
+            print('Sign up type does not exist')
 
         print('Complete')
 
 
-    async def generic_react_add(self,obj,payload):
+    async def post_sign_up(self,ctx,signup,date,*args):
+        """
+        Posts a new signup sheet and adds it to objDict,
+        returning the sheet. Raises if it could not be posted.
+        """
+        startTime = time.perf_counter()
+        channel = await OpSignUp.locate_sign_up(self,ctx,signup)
+        if channel is None:
+            raise ValueError(f'No {self.signUpTypes[signup].channel} channel')
+        print('Sign up found')
+
+        obj=SignUpSheet(self.signUpTypes[signup],channel,*args)
+        print(f'{signup} instantiated')
+        obj.transport = self.transport
+        view = build_sign_up_view(obj) if self.transport != 'reactions' else None
+        await obj.send_message(ctx,date,self.bot.get_cog('GuildCache'),view)
+        print(f'{signup} message sent {obj.messageHandlerID}')
+        async with self.lock:
+            self.objDict.update( {obj.messageHandlerID : obj})
+        self.store.save(obj)
+        print(f'{signup} open for signups after {time.perf_counter()-startTime:.3f}s')
+
+        # The sheet is already usable, the reactions are only a shortcut
+        await obj.seed_reactions(self.bot.restBudget,slots = self.transport != 'buttons')
+        print(f'{signup} reactions added after {time.perf_counter()-startTime:.3f}s')
+        return obj
+
 
-        messageText  = obj.messageText
+    @commands.command(name='ps2-schedule')
+    @commands.has_any_role('CO','Captain','Lieutenant','Sergeant')
+    async def schedule_sign_ups(self,ctx,*,schedule=''):
+        """
+        Usage 1: !ps2-schedule
+                 <squadtype-1> <date>
+                 <squadtype-2> <date> <op-type> <description> <additonal-roles>
+                 ...
+        Usage 2: !ps2-schedule, with a schedule file attached
+
+        Posts many signup sheets at once, one per line, written the
+        same way as for !ps2-signup. Lines starting with # are skipped.
+        A schedule file holds the same lines.
+
+        Sheets are posted at the same time, SIGNUP_SCHEDULE_CONCURRENCY
+        at once. A sheet that is already up, or archived, for the same
+        squad type and date is not posted again, so the command can be
+        re-run.
+        """
+        startTime = time.perf_counter()
+        if ctx.message.attachments:
+            schedule = (await ctx.message.attachments[0].read()).decode('utf-8')
+
+        entries = []
+        results = []
+        for line in schedule.splitlines():
+            if not line.strip() or line.strip().startswith('#'):
+                continue
+            try:
+                signup, date, *args = shlex.split(line)
+            except ValueError:
+                results.append(f'❌ `{line}`: could not read this line')
+                continue
+            if signup not in self.signUpTypes:
+                results.append(f'❌ `{line}`: unknown signup type {signup}')
+                continue
+            if any(entry[0] == signup and entry[1] == date for entry in entries):
+                results.append(f'➖ {signup} {date}: listed twice')
+                continue
+            entries.append((signup,date,args))
+
+        semaphore = asyncio.Semaphore(settings.SIGNUP_SCHEDULE_CONCURRENCY)
+
+        async def post(signup,date,args):
+            async with self.get_post_lock(signup,date):
+                messageID = self.posted_sign_up(signup,date)
+                if messageID is not None:
+                    return f'➖ {signup} {date}: already posted, {messageID}'
+                async with semaphore:
+                    try:
+                        obj = await OpSignUp.post_sign_up(self,ctx,signup,date,*args)
+                    except Exception as error:
+                        traceback.print_exc()
+                        return f'❌ {signup} {date}: {error}'
+            return f'✅ {signup} {date}: {obj.messageHandlerID}'
+
+        results = results + await asyncio.gather(*[post(*entry) for entry in entries])
+        results.append(f'Schedule done in {time.perf_counter()-startTime:.1f}s')
+
+        # Keep each reply inside discord's message length limit
+        reply = ''
+        for result in results:
+            if len(reply) + len(result) + 1 > 2000:
+                await ctx.send(reply)
+                reply = ''
+            reply = reply + result + '\n'
+        await ctx.send(reply)
 
-        message = await self.bot.get_channel(payload.channel_id).fetch_message(obj.messageHandlerID)
-        #message = await self.signUpChannel.fetch_message(self.messageHandlerID)
+
+    async def generic_react_add(self,obj,payload):
+
+        message = obj.get_message_handle(self.bot)
 
         if  str(payload.emoji) == "💥":
             """
@@ -233,20 +665,21 @@ class OpSignUp(commands.Cog):
                 or  'Captain' in list([i.name for i in payload.member.roles])
                 or 'Lieutenant'  in list([i.name for i in payload.member.roles])):
                 try:
-                    pingMessage=str()
-                    for react in obj.reactions:
-                        pingMessage+= ' '.join(list(obj.reactions[react].members.values()))
+                    # Each user only once, in the order of the slots
+                    userIDs = dict.fromkeys(userID for reaction in obj.reactions.values()
+                                            for userID in reaction.members.keys() if userID != 'perm')
+                    pingMessages = plan_ping_messages(f"Pinged by {payload.member.mention} for tonights Ops\n\n",userIDs)
 
-                        #pingMessage=pingMessage.replace('','')
-                    pingMessage = f"Pinged by {payload.member.mention} for tonights Ops\n\n" + pingMessage
-
-                    await self.bot.get_channel(payload.channel_id).send(pingMessage)
+                    # One after another, so the header arrives first
+                    channel = self.bot.get_channel(payload.channel_id)
+                    for pingMessage in pingMessages:
+                        await self.bot.restBudget.call(channel.send,pingMessage)
 
                 except:
                     traceback.print_exc()
             else:
 
-                nanites = [i for i in message.guild.channels if i.name == '💩-nanites-posting']
+                nanites = self.bot.get_cog('GuildCache').text_channel(payload.member.guild,'💩-nanites-posting')
 
                 randText =random.choice(getFuckedTextRotation)
                 randGif = random.choice(getFuckedGifRotation)
@@ -255,116 +688,156 @@ class OpSignUp(commands.Cog):
                 if randText == "you didn't say the magic word!":
                     randGif = "https://tenor.com/view/you-didnt-say-the-magic-word-ah-ah-nope-wagging-finger-gif-17646607"
 
-                await self.bot.get_channel(nanites[0].id).send(f"Get fucked {payload.member.mention}, {randText}\n{randGif}")
+                await nanites.send(f"Get fucked {payload.member.mention}, {randText}\n{randGif}")
 
+            obj.removalLedger.expect(str(payload.user_id),str(payload.emoji))
             await message.remove_reaction(payload.emoji,payload.member)
 
 
-        elif ( str(payload.emoji) in obj.reactions.keys()
-        and not sum([obj.reactions[react].check_member(str(payload.user_id)) for react in obj.reactions])
-        and not OpSignUp.react_max(obj,payload)):
-
+        elif obj.add_signup(str(payload.user_id),str(payload.emoji),f'{str(payload.member.mention)}\n') is not None:
 
+            # Full reactions put the user on the waitlist, and their
+            # reaction is left in place until they are promoted
+            self.signUpChanges[obj.transport] += 1
+            OpSignUp.queue_update_embed(self,obj)
 
-            obj.reactions[str(payload.emoji)].add_member(str(payload.user_id),f'{str(payload.member.mention)}\n')
-
-            print(obj.reactions[str(payload.emoji)].members.values())
-
-            await OpSignUp.generic_update_embed(self,obj,message,payload)
-
-            OpSignUp.update_data_entry(self,obj,obj.messageHandlerID)
+            OpSignUp.update_data_entry(self,obj,'add',{'user':str(payload.user_id),
+                                                      'emoji':str(payload.emoji),
+                                                      'text':f'{str(payload.member.mention)}\n'})
 
         else:
-            obj.ignoreRemove = True
+            obj.removalLedger.expect(str(payload.user_id),str(payload.emoji))
+            self.restCalls[obj.transport] += 1
             await message.remove_reaction(payload.emoji,payload.member)
             print('Reaction removed')
 
 
     async def generic_react_remove(self,obj,payload):
 
-        if obj.ignoreRemove:
-            obj.ignoreRemove = False
+        if obj.removalLedger.consume(str(payload.user_id),str(payload.emoji)):
+            print('Ignoring our own reaction removal')
             return
 
-        if str(payload.emoji) in obj.reactions.keys():
-            message = await self.bot.get_channel(payload.channel_id).fetch_message(obj.messageHandlerID)
-
-            #message = await obj.signUpChannel.fetch_message(obj.messageHandlerID)
-            obj.reactions[str(payload.emoji)].remove_member(str(payload.user_id))
-            await OpSignUp.generic_update_embed(self,obj,message,payload)
+        promoted = obj.remove_signup(str(payload.user_id),str(payload.emoji))
+        if promoted is not None:
+            self.signUpChanges[obj.transport] += 1
+            OpSignUp.queue_update_embed(self,obj)
+            OpSignUp.update_data_entry(self,obj,'remove',{'user':str(payload.user_id),
+                                                         'emoji':str(payload.emoji)})
+            if promoted:
+                print(f'Promoted {promoted} off the waitlist')
 
 
-    async def generic_update_embed(self,obj, message,payload):
-
-
-        embedOrig = message.embeds[0]
+    def queue_update_embed(self,obj):
+        """
+        Requests a re-render of the signup embed. Requests inside
+        the render window are merged into one edit, which always
+        shows the latest state of obj.reactions
+        """
+        async def render():
+            await OpSignUp.generic_update_embed(self,obj)
 
-        embed_dict = embedOrig.to_dict()
-        embed_fields = embed_dict['fields']
+        self.renderQueue.schedule(obj.messageHandlerID,render)
 
-        for index,field in enumerate(embed_fields):
-            if field['name'] == f'{obj.reactions[str(payload.emoji)].symbol} {obj.reactions[str(payload.emoji)].name}':
-                print(obj.reactions[str(payload.emoji)].members.values())
 
-                memberString = ""
-                for member in obj.reactions[str(payload.emoji)].members.values():
-                    memberString = memberString + f"{member}"
-                embed_dict['fields'][index].update({'value': str(memberString)})
+    async def generic_update_embed(self,obj):
+        """
+        Edits the signup message with the embed held by obj.
+        The message is never read back from discord.
+        """
+        self.restCalls[obj.transport] += 1
+        await obj.get_message_handle(self.bot).edit(embed = obj.render_embed())
 
-        embedNew = discord.Embed().from_dict(embed_dict)
 
-        #for field in embed_dict.values():
+    @commands.Cog.listener('on_interaction')
+    async def button_sign_up_check(self,interaction):
+        """
+        Captures signup button clicks. Each click is answered with a
+        single response that edits the sheet in place.
+        """
+        key = sign_up_key(interaction)
+        if key is None or interaction.message is None:
+            return
 
-        #    print(field)
-        await message.edit(embed = embedNew)
+        messageID = interaction.message.id
+        async with self.get_sign_up_lock(messageID):
+            obj = await OpSignUp.get_sign_up(self,messageID)
+            if obj is None:
+                self.restCalls['buttons'] += 1
+                await interaction.response.send_message('This signup is closed.',ephemeral=True)
+                return
+
+            reply = OpSignUp.button_sign_up(self,obj,str(interaction.user.id),f'{interaction.user.mention}\n',key)
+            self.restCalls[obj.transport] += 1
+            if reply is None:
+                # The response carries the latest state, so any queued edit is not needed
+                self.renderQueue.discard(messageID)
+                obj.lastActive = time.time()
+                await interaction.response.edit_message(embed=obj.render_embed())
+            else:
+                await interaction.response.send_message(reply,ephemeral=True)
 
 
+    def button_sign_up(self,obj,userID,userNameText,key):
+        """
+        Applies a button click to the sheet. Clicking your own reaction,
+        or leave, takes you off the sheet. Clicking another reaction
+        moves you to it.
 
-    async def locate_sign_up(self,ctx,signup):
-        print('Lookup signup channel')
-        try:
-            channels = ctx.guild.text_channels
-        except:
-            print('fail')
-            return None
-        print('Got text channel list')
+        Returns None if the sheet changed, otherwise a reason to
+        show the user.
+        """
+        current = obj.signed_up_to(userID)
 
+        if key == LEAVE_KEY or key == current:
+            if current is None:
+                return 'You are not signed up.'
+            obj.remove_signup(userID,current)
+            OpSignUp.update_data_entry(self,obj,'remove',{'user':userID,'emoji':current})
 
-        for channel in channels:
-            try:
-                if self.signUpChannelName[signup][0] == channel.name:
-                    print('Channel Found')
-                    return channel
-            except:
-                print("No channel found")
-        print('Lookup complete')
-
-    def react_max(self,payload):
-
-        if self.reactions[str(payload.emoji)].maxReact < 0:
-            return False
-        elif self.reactions[str(payload.emoji)].currentReact < self.reactions[str(payload.emoji)].maxReact:
-            return False
         else:
-            return True
+            if key not in obj.reactions or obj.reactions[key].maxReact == 0:
+                return 'That role is not open on this signup.'
+            if current is not None:
+                if obj.reactions[key].is_full():
+                    return 'That role is full, you have kept your current place.'
+                obj.remove_signup(userID,current)
+                OpSignUp.update_data_entry(self,obj,'remove',{'user':userID,'emoji':current})
+            obj.add_signup(userID,key,userNameText)
+            OpSignUp.update_data_entry(self,obj,'add',{'user':userID,'emoji':key,'text':userNameText})
 
+        self.signUpChanges[obj.transport] += 1
+        return None
 
-    def update_data_entry(self,obj,messageID):
 
-        # Attempt to write a data entry.
-        #pickle.dump( self, open( "save.p", "wb" ) )
-
-        #loaded_objects = pickle.load( open( "save.p", "rb" )
+    @commands.command(name='ps2-signup-stats')
+    @commands.has_any_role('CO','Captain','Lieutenant','Sergeant')
+    async def sign_up_stats(self,ctx):
+        """
+        Usage: !ps2-signup-stats
+        Shows the REST calls made per signup change, for sheets
+        with reactions, buttons, or both
+        """
+        lines = []
+        for transport in ('reactions','buttons','both'):
+            changes = self.signUpChanges[transport]
+            calls = self.restCalls[transport]
+            perChange = f'{calls/changes:.2f}' if changes else '-'
+            lines.append(f'{transport}: {changes} signups, {calls} REST calls, {perChange} per signup')
+        await ctx.send('\n'.join(lines))
 
-        print(obj.__dict__)
-        #print(self.signUpChannel.__dict__)
-        #def obj_dict(obj):
-    #        return obj.__dict__
 
-        #with open(f"{messageID}.pickle","w") as database:
 
-        #    pickle.dump(obj,database, protocol=pickle.HIGHEST_PROTOCOL)
+    async def locate_sign_up(self,ctx,signup):
+        print('Lookup signup channel')
+        channel = self.bot.get_cog('GuildCache').text_channel(ctx.guild,self.signUpTypes[signup].channel)
+        if channel is None:
+            print("No channel found")
+        return channel
 
-        #    testObj = pickle.load(database)
-        #    print(testObj)
-#
+    def update_data_entry(self,obj,op,data):
+        """
+        Journals a change that has been applied to obj,
+        so it is not lost on restart
+        """
+        self.store.record(obj,op,data)
@@ -1,22 +1,162 @@
+import asyncio
 import discord
+import json
+import os
+import time
 import traceback
+from collections import deque, namedtuple
 from datetime import datetime
 
+from messagetemplates import templates, TemplateCache
+
+# Discord embed limits
+EMBED_FIELD_LIMIT = 1024
+EMBED_MAX_FIELDS = 25
+EMBED_MAX_CHARS = 6000
+
+
 class GenericSignup:
     """
     Overarching signup class.
     This class allows one to query the max reacts,
     and then change them.
 
-    This class also grabs pregen messages when required
+    Pregen messages come from messagetemplates.templates
     """
     def __init__(self):
         pass
 
-    def get_message(messageLocation):
-        with open(messageLocation,'r') as f:
-            messageText = f.read()
-            return messageText
+    def index_reactions(self):
+        """
+        Links every ReactionData to a shared index of
+        {userID : reaction key}, so we can tell in one lookup
+        which reaction (if any) a user is signed up to
+        """
+        self.memberIndex = {}
+        for key, reaction in self.reactions.items():
+            reaction.key = key
+            reaction.memberIndex = self.memberIndex
+            for userID in reaction.members.keys():
+                if userID != 'perm':
+                    self.memberIndex[userID] = key
+            for userID in reaction.waitlist.keys():
+                self.memberIndex[userID] = key
+
+    def signed_up_to(self,userID):
+        """
+        Returns the reaction key the user is signed up
+        or waiting for, or None
+        """
+        return self.memberIndex.get(userID)
+
+    def add_signup(self,userID,emoji,userNameText):
+        """
+        Signs the user up to a reaction. If the reaction is full
+        the user joins its waitlist instead.
+
+        Returns 'added' or 'waiting', or None if the signup is refused:
+        the user is already on this sheet, or the reaction does not
+        exist or is closed (max of 0).
+        """
+        reaction = self.reactions.get(emoji)
+        if reaction is None or self.signed_up_to(userID) is not None:
+            return None
+        if not reaction.is_full():
+            reaction.add_member(userID,userNameText)
+            return 'added'
+        if reaction.maxReact != 0:
+            reaction.add_waiting(userID,userNameText)
+            return 'waiting'
+        return None
+
+    def remove_signup(self,userID,emoji):
+        """
+        Takes the user off a reaction, or its waitlist.
+
+        Returns the list of user IDs promoted off the waitlist into
+        the freed place, or None if the user was not on the reaction.
+        """
+        if self.signed_up_to(userID) != emoji:
+            return None
+        reaction = self.reactions[emoji]
+        if userID in reaction.waitlist:
+            reaction.remove_waiting(userID)
+            return []
+        reaction.remove_member(userID)
+        return reaction.promote_waiting()
+
+    def set_limit(self,emoji,maxReact):
+        """
+        Changes the max for a reaction, returning the list of
+        user IDs promoted off the waitlist if it went up
+        """
+        self.reactions[emoji].maxReact = maxReact
+        return self.reactions[emoji].promote_waiting()
+
+    def to_state(self):
+        """
+        Returns the sheet as plain values, for SignUpStore
+        """
+        return {'signUpType' : self.signUpType,
+                'signUpChannelID' : self.signUpChannelID,
+                'messageHandlerID' : self.messageHandlerID,
+                'messageText' : self.messageText,
+                'mentionRoles' : self.mentionRoles,
+                'opsType' : getattr(self,'opsType',None),
+                'embed' : self.embed.to_dict(),
+                'reactionFields' : self.reactionFields,
+                'headerFields' : self.headerFields,
+                'date' : self.date,
+                'startTime' : self.startTime,
+                'transport' : self.transport,
+                'createdTime' : self.createdTime,
+                'reactions' : [[key, reaction.name, reaction.symbol, reaction.maxReact, reaction.members, reaction.waitlist]
+                               for key, reaction in self.reactions.items()]}
+
+    @classmethod
+    def from_state(cls,state):
+        """
+        Rebuilds a sheet from to_state() without calling the
+        constructor, so no message templates are read
+        """
+        obj = cls.__new__(cls)
+        obj.signUpType = state['signUpType']
+        obj.signUpChannelID = state['signUpChannelID']
+        obj.messageHandlerID = state['messageHandlerID']
+        obj.messageHandle = None
+        obj.messageText = state['messageText']
+        obj.mentionRoles = state['mentionRoles']
+        if state['opsType'] is not None:
+            obj.opsType = state['opsType']
+        obj.removalLedger = RemovalLedger()
+        obj.embed = discord.Embed.from_dict(state['embed'])
+        obj.reactionFields = state['reactionFields']
+        obj.headerFields = state.get('headerFields',min(obj.reactionFields.values()))
+        obj.date = state.get('date')
+        obj.startTime = state.get('startTime')
+        obj.transport = state.get('transport','reactions')
+        obj.createdTime = state.get('createdTime',time.time())
+        obj.lastActive = time.time()
+        obj.fieldLayout = None # Unknown, so the first render rebuilds every reaction field
+
+        obj.reactions = {}
+        for key, name, symbol, maxReact, members, *waitlist in state['reactions']:
+            reaction = ReactionData(name,symbol,maxReact)
+            reaction.set_members(members,waitlist[0] if waitlist else {})
+            obj.reactions[key] = reaction
+        obj.index_reactions()
+        return obj
+
+    def apply_event(self,event):
+        """
+        Replays one SignUpStore journal entry onto the sheet
+        """
+        if event['op'] == 'add':
+            self.add_signup(event['user'],event['emoji'],event['text'])
+        elif event['op'] == 'remove':
+            self.remove_signup(event['user'],event['emoji'])
+        elif event['op'] == 'limit':
+            self.set_limit(event['emoji'],event['max'])
 
     async def get_reaction_details(self,ctx):
 
@@ -32,7 +172,11 @@ class GenericSignup:
         await ctx.channel.send(message)
 
     async def set_reaction_details(self,ctx,*args):
-
+        """
+        Changes the max reacts, returning {reaction : new max}
+        for every reaction that was changed
+        """
+        changes = {}
         for index, value in enumerate(args):
 
             try:
@@ -40,7 +184,10 @@ class GenericSignup:
                 if value in self.reactions.keys():
 
                     print(f"New val {args[index+1]}")
-                    self.reactions[value].maxReact =int(args[index+1])
+                    promoted = self.set_limit(value,int(args[index+1]))
+                    changes[value] = self.reactions[value].maxReact
+                    if promoted:
+                        print(f"Promoted {promoted} off the waitlist")
                     print(f"{self.reactions[value].maxReact}")
 
                 else:
@@ -50,6 +197,7 @@ class GenericSignup:
 
         await ctx.channel.send("New Values:")
         await self.get_reaction_details(ctx)
+        return changes
 
 
 
@@ -121,19 +269,128 @@ class GenericEmbed(GenericSignup):
                 raise
         return dtint
 
-    async def send_message(self,ctx,date):
+    def expiry_time(self,grace,maxAge):
+        """
+        Returns the unix time after which the sheet can be archived
+        """
+        if self.startTime is not None:
+            expiry = self.startTime + grace
+        else:
+            expiry = self.createdTime + maxAge
+        return max(expiry,self.lastActive + grace)
 
-        roles = await ctx.guild.fetch_roles()
+    def get_message_handle(self,bot):
+        """
+        Returns a handle to the signup message that can be edited
+        and have reactions removed without fetching it first
+        """
+        if getattr(self,'messageHandle',None) is None:
+            channel = bot.get_channel(self.signUpChannelID)
+            self.messageHandle = channel.get_partial_message(self.messageHandlerID)
+        return self.messageHandle
 
-        roleText = ""
-        for role in roles:
+    def render_embed(self):
+        """
+        Brings the reaction fields of the embed held by this signup
+        up to date, and returns it.
+
+        Each reaction keeps its lists split into fields as they change
+        (see FieldChunks), and only the fields that are shown are read,
+        so the cost of a render does not grow with the number of people
+        signed up. Only reactions that changed since the last render
+        are updated, in place by index if no reaction changed its number
+        of fields. Long member lists spill into continuation fields. If
+        the embed would go over discord's limits, the longest lists are
+        cut short and the number of hidden members is added to the field
+        name.
+        """
+        changed = []
+        for key, reaction in self.reactions.items():
+            if reaction.dirty:
+                reaction.dirty = False
+                changed.append(key)
+        if not changed and self.fieldLayout is not None:
+            return self.embed
+
+        # No reaction can show more fields, or more text, than the embed holds
+        fixedChars = len(self.embed) - sum(len(field.name) + len(field.value) for field in self.embed.fields[self.headerFields:])
+        chunks = {} # {key : [(field text, number of users)]}
+        for key, reaction in self.reactions.items():
+            chunks[key] = []
+            length = fixedChars
+            for chunk, users in reaction.field_chunks():
+                length += len(chunk)
+                if chunks[key] and (len(chunks[key]) == EMBED_MAX_FIELDS - self.headerFields or length > EMBED_MAX_CHARS):
+                    break
+                chunks[key].append((chunk,users))
+        shown = {key : len(chunks[key]) for key in self.reactions.keys()}
+
+        def trim_longest():
+            longest = max(shown,key=shown.get)
+            if shown[longest] <= 1:
+                return None
+            shown[longest] -= 1
+            return longest
+
+        while self.headerFields + sum(shown.values()) > EMBED_MAX_FIELDS and trim_longest():
+            pass
 
-            if role.name in self.mentionRoles:
-                roleText = f'{role.mention} ' + roleText
-            else:
-                pass
+        # Each reaction is laid out once, and again only when it is cut shorter
+        fields = {key : self.layout_fields(key,chunks[key][:shown[key]]) for key in self.reactions.keys()}
+        sizes = {key : sum(len(name) + len(value) for name, value in fields[key]) for key in self.reactions.keys()}
+        while fixedChars + sum(sizes.values()) > EMBED_MAX_CHARS:
+            trimmed = trim_longest()
+            if trimmed is None:
+                break
+            fields[trimmed] = self.layout_fields(trimmed,chunks[trimmed][:shown[trimmed]])
+            sizes[trimmed] = sum(len(name) + len(value) for name, value in fields[trimmed])
+
+        if shown == self.fieldLayout:
+            for key in changed:
+                for number, (name, value) in enumerate(fields[key]):
+                    self.embed.set_field_at(self.reactionFields[key] + number, name = name, value = value, inline=True)
+        else:
+            while len(self.embed.fields) > self.headerFields:
+                self.embed.remove_field(self.headerFields)
+            self.reactionFields = {}
+            for key in self.reactions.keys():
+                self.reactionFields[key] = len(self.embed.fields)
+                for name, value in fields[key]:
+                    self.embed.add_field(name = name, value = value, inline=True)
+            self.fieldLayout = shown
+        return self.embed
+
+    def layout_fields(self,key,chunks):
+        """
+        Returns [(field name, field value)] for the fields of one
+        reaction, showing chunks, its first [(field text, number of users)]
+        """
+        reaction = self.reactions[key]
+        hidden = len(reaction.memberChunks) + len(reaction.waitlist) - sum(users for chunk, users in chunks)
+        fields = []
+        for number, (chunk, users) in enumerate(chunks):
+            name = f'{reaction.symbol} {reaction.name}'
+            if number > 0:
+                name = name + ' (cont.)'
+            if hidden and number == len(chunks) - 1:
+                name = name + f' (+{hidden} more)'
+            fields.append((name,chunk))
+        return fields
+
+    async def send_message(self,ctx,date,guildCache,view=None):
+
+        if self.fromTemplate:
+            self.messageText = TemplateCache.render(self.messageText,date=date,opsType=getattr(self,'opsType',''))
+
+        # Role names typed into the command arrive split on spaces
+        roleText = ''.join(f'{role.mention} ' for role in guildCache.roles(ctx.guild,self.mentionRoles))
+        self.date = date
+        self.startTime = None
+        self.createdTime = time.time()
+        self.lastActive = self.createdTime
         try:
             startTime = self.convert_date_to_unix(date)
+            self.startTime = startTime
             embed = discord.Embed(title = f'Local time: <t:{startTime}:F>', description =self.messageText ,color=0xff0000)
             embed.add_field( name = "Time till start", value = f'<t:{startTime}:R>', inline=False)
 
@@ -146,24 +403,175 @@ class GenericEmbed(GenericSignup):
         except:
             pass
 
+        self.headerFields = len(embed.fields)
+        self.reactionFields = {}
+        self.fieldLayout = {}
         for reaction in self.reactions.keys():
+            self.reactionFields[reaction] = len(embed.fields)
+            self.fieldLayout[reaction] = 1
             embed.add_field( name = f'{self.reactions[reaction].symbol} {self.reactions[reaction].name}', value = f'{self.reactions[reaction].members["perm"]}', inline=True)
 
         embed.set_footer(text=f'\n**If your name does not appear, your signup has not happened.**\n**To remove or change signup, unreact.**')
 
-        messageHandler = await ctx.guild.get_channel(self.signUpChannelID).send(roleText,embed=embed)
+        self.embed = embed
+
+        if view is None:
+            messageHandler = await ctx.guild.get_channel(self.signUpChannelID).send(roleText,embed=embed)
+        else:
+            messageHandler = await ctx.guild.get_channel(self.signUpChannelID).send(roleText,embed=embed,view=view)
+            view.stop() # Clicks are handled by OpSignUp, not the view
         self.messageHandlerID = messageHandler.id
+        self.messageHandle = messageHandler
+
+    async def seed_reactions(self,budget,slots=True):
+        """
+        Adds the signup reactions, plus 💥, to the posted message.
+        With slots=False only 💥 is added.
+        The calls are started in order through the rate budget,
+        but do not wait on each other.
+        """
+        emojis = (list(self.reactions.keys()) if slots else []) + ["💥"]
+        results = await asyncio.gather(*[budget.call(self.messageHandle.add_reaction,emoji) for emoji in emojis],
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result,Exception):
+                traceback.print_exception(type(result),result,result.__traceback__)
 
 
-        try:
-            message = await ctx.guild.get_channel(self.signUpChannelID).fetch_message(self.messageHandlerID)
-            for reaction in self.reactions.keys():
-                await message.add_reaction(f"{reaction}")
 
-            await message.add_reaction(f"💥")
-        except:
-            traceback.print_exc()
+class RemovalLedger():
+    """
+    Remembers the reactions the bot has removed itself, keyed by
+    (userID, emoji), so that only the remove event discord echoes
+    back for each one is ignored. Any other remove on the sheet is
+    handled as a normal unreact.
+
+    Entries expire after ttl seconds in case the echo never arrives.
+    """
+    __slots__ = ('ttl','pending')
 
+    def __init__(self,ttl=30):
+        self.ttl = ttl
+        self.pending = {} # {(userID, emoji) : deque of expiry times}
+
+    def expire(self):
+        now = time.monotonic()
+        for key in [key for key, times in self.pending.items() if times[-1] < now]:
+            del self.pending[key]
+        for times in self.pending.values():
+            while times[0] < now:
+                times.popleft()
+
+    def expect(self,userID,emoji):
+        """
+        Call before the bot removes the user's reaction
+        """
+        self.expire()
+        self.pending.setdefault((userID,emoji),deque()).append(time.monotonic() + self.ttl)
+
+    def consume(self,userID,emoji):
+        """
+        Returns True, and forgets the entry, if this remove
+        was one the bot made itself
+        """
+        self.expire()
+        times = self.pending.get((userID,emoji))
+        if not times:
+            return False
+        times.popleft()
+        if not times:
+            del self.pending[(userID,emoji)]
+        return True
+
+
+class FieldChunk():
+    """
+    One embed field's worth of the users in a FieldChunks list
+    """
+    __slots__ = ('entries','length','text','previous','next')
+
+    def __init__(self,previous=None):
+        self.entries = {} # {userID : userNameText}
+        self.length = 0
+        self.text = None # Joined up when first asked for
+        self.previous = previous
+        self.next = None
+
+
+class FieldChunks():
+    """
+    A list of users as shown in an embed, kept split into chunks that
+    each fit in one field. Every user is mapped to the chunk they are
+    in, so adding or removing one only touches that chunk and the cost
+    does not grow with the length of the list.
+
+    New users go on the end of the last chunk. A chunk left small
+    enough by a removal is merged into its neighbour, so the chunks
+    stay at least half full on average. header is shown at the start
+    of the first chunk.
+    """
+    __slots__ = ('header','limit','first','last','chunkOf')
+
+    def __init__(self,header,limit=EMBED_FIELD_LIMIT):
+        self.header = header
+        self.limit = limit
+        self.first = self.last = FieldChunk()
+        self.first.length = len(header)
+        self.chunkOf = {} # {userID : FieldChunk}
+
+    def __len__(self):
+        return len(self.chunkOf)
+
+    def __iter__(self):
+        """
+        Yields (field text, number of users) for each chunk in order
+        """
+        chunk = self.first
+        while chunk is not None:
+            if chunk.text is None:
+                chunk.text = ''.join(chunk.entries.values())
+                if chunk is self.first:
+                    chunk.text = self.header + chunk.text
+            yield chunk.text, len(chunk.entries)
+            chunk = chunk.next
+
+    def add(self,userID,userNameText):
+        userNameText = userNameText[:self.limit]
+        chunk = self.last
+        if chunk.length + len(userNameText) > self.limit:
+            chunk = FieldChunk(self.last)
+            self.last.next = chunk
+            self.last = chunk
+        chunk.entries[userID] = userNameText
+        chunk.length += len(userNameText)
+        chunk.text = None
+        self.chunkOf[userID] = chunk
+
+    def remove(self,userID):
+        chunk = self.chunkOf.pop(userID)
+        chunk.length -= len(chunk.entries.pop(userID))
+        chunk.text = None
+        if chunk.next is not None:
+            self.merge(chunk,chunk.next)
+        if chunk.previous is not None:
+            self.merge(chunk.previous,chunk)
+
+    def merge(self,chunk,following):
+        """
+        Moves the users of following onto the end of chunk, if they fit
+        """
+        if chunk.length + following.length > self.limit:
+            return
+        for userID, userNameText in following.entries.items():
+            chunk.entries[userID] = userNameText
+            self.chunkOf[userID] = chunk
+        chunk.length += following.length
+        chunk.text = None
+        chunk.next = following.next
+        if following.next is None:
+            self.last = chunk
+        else:
+            following.next.previous = chunk
 
 
 class ReactionData():
@@ -174,12 +582,86 @@ class ReactionData():
     Also contains the functions to access and alter
     this data.
     """
-    def __init__(self,name,emoji,maxReact):
+    __slots__ = ('name','symbol','maxReact','currentReact','members','waitlist',
+                 'key','memberIndex','memberChunks','waitlistChunks','dirty')
+
+    def __init__(self,name,emoji,maxReact,memberIndex=None):
         self.name = name
         self.symbol = emoji
         self.maxReact = maxReact
         self.currentReact = 0
         self.members = {'perm':'\u200b'}
+        self.waitlist = {} # {userID : userNameText}, in the order they joined, first come first promoted
+        self.key = emoji
+        self.memberIndex = memberIndex # Shared with the owning signup, see GenericSignup.index_reactions
+
+        # The member list and waitlist as shown in the embed, kept up
+        # to date on every add and remove. dirty marks them as not yet rendered.
+        self.memberChunks = FieldChunks(self.members['perm'])
+        self.waitlistChunks = None # Made when someone first has to wait
+        self.dirty = True
+
+    def set_members(self,members,waitlist):
+        """
+        Replaces the member dictionary and waitlist,
+        e.g. when restoring from the store
+        """
+        self.members = members
+        self.waitlist = dict(waitlist)
+        self.currentReact = len(members) - 1 # Not counting 'perm'
+        self.memberChunks = FieldChunks(members['perm'])
+        for userID, userNameText in members.items():
+            if userID != 'perm':
+                self.memberChunks.add(userID,userNameText)
+        self.waitlistChunks = None
+        for userID, userNameText in self.waitlist.items():
+            self.add_waiting_chunk(userID,userNameText)
+        self.dirty = True
+
+    def field_chunks(self):
+        """
+        Yields (field text, number of users) for each embed field
+        of this reaction, the members first and then the waitlist
+        """
+        yield from self.memberChunks
+        if self.waitlist:
+            yield from self.waitlistChunks
+
+    def add_waiting(self,userID,userNameText):
+        """
+        Adds a user to the end of the waitlist
+        """
+        self.waitlist[userID] = userNameText
+        self.add_waiting_chunk(userID,userNameText)
+        self.dirty = True
+        if self.memberIndex is not None:
+            self.memberIndex[userID] = self.key
+
+    def add_waiting_chunk(self,userID,userNameText):
+        if self.waitlistChunks is None:
+            self.waitlistChunks = FieldChunks('*Waitlist:*\n')
+        self.waitlistChunks.add(userID,userNameText)
+
+    def remove_waiting(self,userID):
+        del self.waitlist[userID]
+        self.waitlistChunks.remove(userID)
+        self.dirty = True
+        if self.memberIndex is not None:
+            self.memberIndex.pop(userID,None)
+
+    def promote_waiting(self):
+        """
+        Moves users from the front of the waitlist into the
+        reaction while there is room. Returns their user IDs.
+        """
+        promoted = []
+        while self.waitlist and not self.is_full():
+            userID = next(iter(self.waitlist))
+            userNameText = self.waitlist.pop(userID)
+            self.waitlistChunks.remove(userID)
+            self.add_member(userID,userNameText)
+            promoted.append(userID)
+        return promoted
 
     def add_member(self, userID,userNameText):
         """
@@ -188,6 +670,10 @@ class ReactionData():
         """
         self.members.update({userID:userNameText})
         self.currentReact += 1
+        self.memberChunks.add(userID,userNameText)
+        self.dirty = True
+        if self.memberIndex is not None:
+            self.memberIndex[userID] = self.key
 
     def remove_member(self, userID):
         """
@@ -195,6 +681,10 @@ class ReactionData():
         """
         del self.members[userID]
         self.currentReact -= 1
+        self.memberChunks.remove(userID)
+        self.dirty = True
+        if self.memberIndex is not None:
+            self.memberIndex.pop(userID,None)
 
 
     def check_member(self, userID):
@@ -206,183 +696,96 @@ class ReactionData():
         else:
             return False
 
-
-class ArmourDogs(GenericEmbed):
-
-    def __init__(self,channel):
-        super(ArmourDogs,self).__init__()
-        self.signUpChannelID = channel.id
-        self.messageText = ArmourDogs.get_message('messages/armourdogs.txt')
-        self.messageHandlerID = None
-        self.ignoreRemove = False
-        self.reactions={'<:Icon_Vanguard:795727955896565781>' : ReactionData('Vanguard','<:Icon_Vanguard:795727955896565781>',-1),
-                        '<:Icon_Sunderer:795727911549272104>' : ReactionData('Sunderer','<:Icon_Sunderer:795727911549272104>',-1),
-                        '<:Icon_Lightning:795727852875677776>' : ReactionData('Lightning','<:Icon_Lightning:795727852875677776>',-1),
-                        '<:Icon_Harasser:795727814220840970>' : ReactionData('Harasser','<:Icon_Harasser:795727814220840970>',-1),
-                        '<:Icon_Spawn_Beacon_NC:795729269891530792>' : ReactionData('Reserve/Maybe','<:Icon_Spawn_Beacon_NC:795729269891530792>',-1)
-                       }
-        self.mentionRoles =['ArmourDogs']
-
-class Bastion(GenericEmbed):
-
-    def __init__(self,channel):
-        super(Bastion,self).__init__()
-        self.signUpChannelID = channel.id
-        self.messageText = Bastion.get_message('messages/bastion.txt')
-        self.messageHandlerID = None
-        self.ignoreRemove = False
-        self.reactions={'<:tdkdsmall:803387734172762143>' : ReactionData('Woof','<:tdkdsmall:803387734172762143>',-1)}
-        self.mentionRoles =['TDKD']
-
-class DogFighters(GenericEmbed):
-
-    def __init__(self,channel):
-        super(DogFighters,self).__init__()
-        self.signUpChannelID = channel.id
-        self.messageText = DogFighters.get_message('messages/dogfighters.txt')
-        self.messageHandlerID = None
-        self.ignoreRemove = False
-        self.reactions={'<:Icon_Reaver:795727893342846986>' : ReactionData('Reaver','<:Icon_Reaver:795727893342846986>',-1),
-                        '<:Icon_Dervish:861303237062950942>' : ReactionData('Dervish','<:Icon_Dervish:861303237062950942>',-1),
-                        '<:Icon_Spawn_Beacon_NC:795729269891530792>' : ReactionData('Reserve/Maybe','<:Icon_Spawn_Beacon_NC:795729269891530792>',-1)
-                       }
-        self.mentionRoles =['DogFighters']
-
-class Logidogs(GenericEmbed):
-
-    def __init__(self,channel):
-        super(Logidogs,self).__init__()
-        self.signUpChannelID = channel.id
-        self.messageText = Logidogs.get_message('messages/logidogs.txt')
-        self.messageHandlerID = None
-        self.ignoreRemove = False
-        self.reactions={'<:Icon_Infiltrator:795726922264215612>' : ReactionData('Hacker','<:Icon_Infiltrator:795726922264215612>',4),
-                        '<:Icon_Engineer:795726888763916349>' : ReactionData('Router','<:Icon_Engineer:795726888763916349>',2),
-                        '<:Icon_Spawn_Beacon_NC:795729269891530792>' : ReactionData('Reserve/Maybe','<:Icon_Spawn_Beacon_NC:795729269891530792>',-1)
-                       }
-        self.mentionRoles =['LogiDogs']
-
-class RoyalAirWoof(GenericEmbed):
-
-    def __init__(self,channel):
-        super(RoyalAirWoof,self).__init__()
-        self.signUpChannelID = channel.id
-        self.messageText = RoyalAirWoof.get_message('messages/royalairwoof.txt')
-        self.messageHandlerID = None
-        self.ignoreRemove = False
-        self.reactions={'<:Icon_Galaxy:795727799591239760>' : ReactionData('Gal-Pilot','<:Icon_Galaxy:795727799591239760>',-1),
-                        '<:Icon_Liberator:795727831605837874>' : ReactionData('Lib-Pilot','<:Icon_Liberator:795727831605837874>',-1),
-                        '<:Icon_Valkyrie:795727937735098388>' : ReactionData('Valk-Pilot','<:Icon_Valkyrie:795727937735098388>',-1),
-                        '<:Icon_Engineer:795726888763916349>' : ReactionData('Gunner','<:Icon_Engineer:795726888763916349>',-1),
-                        '<:Icon_Spawn_Beacon_NC:795729269891530792>' : ReactionData('Reserve/Maybe','<:Icon_Spawn_Beacon_NC:795729269891530792>',-1)
-                       }
-        self.mentionRoles =['RAW']
-
-class SoberDogs(GenericEmbed):
-
-    def __init__(self,channel):
-        super(SoberDogs,self).__init__()
-        self.signUpChannelID = channel.id
-        self.messageText = SoberDogs.get_message('messages/soberdogs.txt')
-        self.messageHandlerID = None
-        self.ignoreRemove = False
-        self.reactions={'<:Icon_Heavy_Assault:795726910344003605>' : ReactionData('Heavy','<:Icon_Heavy_Assault:795726910344003605>',4),
-                        '<:Icon_Combat_Medic:795726867960692806>' : ReactionData('Medic','<:Icon_Combat_Medic:795726867960692806>',4),
-                        '<:Icon_Engineer:795726888763916349>' : ReactionData('Engineer','<:Icon_Engineer:795726888763916349>',2),
-                        '<:Icon_Infiltrator:795726922264215612>' : ReactionData('Infiltrator','<:Icon_Infiltrator:795726922264215612>',1),
-                        '<:Icon_Light_Assault:795726936759468093>' : ReactionData('Light assault','<:Icon_Light_Assault:795726936759468093>',1),
-                        '<:Icon_MAX:795726948365631559>' : ReactionData('MAX','<:Icon_MAX:795726948365631559>',0),
-                        '<:Icon_Spawn_Beacon_NC:795729269891530792>' : ReactionData('Reserve/Maybe','<:Icon_Spawn_Beacon_NC:795729269891530792>',-1)
-                       }
-        self.mentionRoles =['Soberdogs']
-
-class SquadLead(GenericEmbed):
-
-    def __init__(self,channel):
-        super(SquadLead,self).__init__()
-        self.signUpChannelID = channel.id
-        self.messageText = SquadLead.get_message('messages/opsnight.txt')
-        self.messageHandlerID = None
-        self.ignoreRemove = False
-
-        self.reactions={'<:Icon_A:795729153072431104>' : ReactionData('PL','<:Icon_A:795729153072431104>',-1),
-                        '<:Icon_B:795729164891062343>' : ReactionData('SL','<:Icon_B:795729164891062343>',-1),
-                        '<:Icon_C:795729176363270205>' : ReactionData('FL','<:Icon_C:795729176363270205>',-1),
-                        '<:Icon_D:795729189260754956>' : ReactionData('Specialist SL','<:Icon_D:795729189260754956>',-1),
-                        '<:NC:727306728470872075>' : ReactionData('Guest SL','<:NC:727306728470872075>',2),
-                        '<:Icon_Spawn_Beacon_NC:795729269891530792>' : ReactionData('Reserve','<:Icon_Spawn_Beacon_NC:795729269891530792>',-1)
-                        #'<:Icon_Heavy_Assault:795726910344003605>' : ReactionData('Soberdog S/FL','<:Icon_Heavy_Assault:795726910344003605>',-1),
-                        #'<:Icon_Galaxy:795727799591239760>' : ReactionData('RAW S/FL','<:Icon_Galaxy:795727799591239760>',-1),
-                        #'<:Icon_Vanguard:795727955896565781>' : ReactionData('Armourdog S/FL','<:Icon_Vanguard:795727955896565781>',-1),
-                        #'<:Icon_Reaver:795727893342846986>' : ReactionData('Dogfighter S/FL','<:Icon_Reaver:795727893342846986>',-1)
-                       }
-        self.mentionRoles =['CO','Captain','Lieutenant','Sergeant','Corporal','Guest SL']
+    def is_full(self):
+        """
+        Checks if the reaction has hit its max. A max of -1 is unlimited
+        """
+        if self.maxReact < 0:
+            return False
+        return self.currentReact >= self.maxReact
 
 
-class CobaltClash(GenericEmbed):
+class SignUpSheet(GenericEmbed):
+    """
+    A signup sheet built from one of the SignUpTypes in signuptypes.json.
 
-    def __init__(self,channel,opsType, message,additionalRoles=[]):
+    Types that take arguments (see SIGNUP_ARGUMENTS) are given them in
+    order after the channel, as typed in the !ps2-signup command.
+    """
+    def __init__(self,signUpType,channel,*args):
+        super().__init__()
+        if len(args) > len(signUpType.arguments):
+            raise TypeError(f'{signUpType.name} takes at most {len(signUpType.arguments)} arguments')
+        values = dict(zip(signUpType.arguments,args))
+        for argument in signUpType.arguments:
+            if argument not in values and argument != 'additionalRoles':
+                raise TypeError(f'{signUpType.name} is missing the {argument} argument')
+
+        self.signUpType = signUpType.name
         self.signUpChannelID = channel.id
-        self.opsType=opsType
-        self.messageText = message
+        # Only the built-in templates are filled in, a typed message is posted as it is
+        self.fromTemplate = 'message' not in values
+        if 'message' in values:
+            self.messageText = values['message']
+        else:
+            self.messageText = templates.get(signUpType.template)
+        if 'opsType' in values:
+            self.opsType = values['opsType']
         self.messageHandlerID = None
-        self.ignoreRemove = False
-        self.reactions={'<:NC:727306728470872075>' : ReactionData('Coming','<:NC:727306728470872075>',-1),
-                        '<:Icon_Spawn_Beacon_NC:795729269891530792>' : ReactionData('Reserve/Maybe','<:Icon_Spawn_Beacon_NC:795729269891530792>',-1),
-                       }
-
-        self.mentionRoles = additionalRoles
-
+        self.date = None
+        self.transport = 'reactions' # or 'buttons' or 'both', see signupviews.py
+        self.removalLedger = RemovalLedger()
+        # A new sheet has no one on it, so the slots can share the
+        # member index from the start rather than via index_reactions
+        self.memberIndex = {}
+        self.reactions = {slot.emoji : ReactionData(slot.name,slot.emoji,slot.maxReact,self.memberIndex) for slot in signUpType.slots}
+        self.mentionRoles = list(signUpType.mentionRoles) + values.get('additionalRoles','').split()
 
-class JointOps(GenericEmbed):
 
-    def __init__(self,channel,opsType, message):
-        self.signUpChannelID = channel.id
-        self.opsType=opsType
-        self.messageText = message
-        self.messageHandlerID = None
-        self.ignoreRemove = False
-        self.reactions={'<:NC:727306728470872075>' : ReactionData('Coming','<:NC:727306728470872075>',-1),
-                        '<:Icon_Spawn_Beacon_NC:795729269891530792>' : ReactionData('Reserve/Maybe','<:Icon_Spawn_Beacon_NC:795729269891530792>',-1),
-                       }
-        self.mentionRoles =['TDKD']
+SIGNUP_TYPES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),'signuptypes.json')
 
-class NCAF(GenericEmbed):
-
-    def __init__(self,channel,opsType, message,additionalRoles=[]):
-        self.signUpChannelID = channel.id
-        self.opsType=opsType
-        self.messageText = message
-        self.messageHandlerID = None
-        self.ignoreRemove = False
-        self.reactions={'<:NC:727306728470872075>' : ReactionData('Coming','<:NC:727306728470872075>',-1),
-                        '<:Icon_Spawn_Beacon_NC:795729269891530792>' : ReactionData('Reserve/Maybe','<:Icon_Spawn_Beacon_NC:795729269891530792>',-1),
-                       }
-        self.mentionRoles = additionalRoles
+SIGNUP_ARGUMENTS = ('opsType','message','additionalRoles')
 
-class Training(GenericEmbed):
+SlotPrototype = namedtuple('SlotPrototype',['emoji','name','maxReact'])
 
-    def __init__(self,channel,opsType, message,additionalRoles=[]):
-        self.signUpChannelID = channel.id
-        self.opsType=opsType
-        self.messageText = message
-        self.messageHandlerID = None
-        self.ignoreRemove = False
-        self.reactions={'<:NC:727306728470872075>' : ReactionData('Coming','<:NC:727306728470872075>',-1),
-                        '<:Icon_Spawn_Beacon_NC:795729269891530792>' : ReactionData('Reserve/Maybe','<:Icon_Spawn_Beacon_NC:795729269891530792>',-1),
-                       }
-        self.mentionRoles = additionalRoles
+SignUpType = namedtuple('SignUpType',['name','channel','template','arguments','mentionRoles','slots'])
 
-class OutfitWars(GenericEmbed):
 
-    def __init__(self,channel,opsType, message,additionalRoles=[]):
-        self.signUpChannelID = channel.id
-        self.opsType=opsType
-        self.messageText = message
-        self.messageHandlerID = None
-        self.ignoreRemove = False
-        self.reactions={'<:NC:727306728470872075>' : ReactionData('Coming','<:NC:727306728470872075>',-1),
-                        '<:Icon_Spawn_Beacon_NC:795729269891530792>' : ReactionData('Reserve/Maybe','<:Icon_Spawn_Beacon_NC:795729269891530792>',-1),
-                       }
+def load_signup_types(path):
+    """
+    Reads and checks the signup type definitions, returning
+    {name : SignUpType}. Raises ValueError describing the first
+    problem found.
+    """
+    with open(path,'r',encoding='utf-8') as f:
+        definitions = json.load(f)
 
-        self.mentionRoles = additionalRoles
+    signUpTypes = {}
+    for name, definition in definitions.items():
+        try:
+            channel = definition['channel']
+            template = definition.get('template')
+            arguments = tuple(definition.get('arguments',[]))
+            mentionRoles = tuple(definition.get('mentionRoles',[]))
+            slots = tuple(SlotPrototype(emoji,slotName,int(maxReact)) for emoji, slotName, maxReact in definition['slots'])
+        except (KeyError,TypeError,ValueError) as error:
+            raise ValueError(f'Signup type {name} is malformed: {error!r}')
+
+        if not isinstance(channel,str) or not all(isinstance(role,str) for role in mentionRoles):
+            raise ValueError(f'Signup type {name}: channel and mentionRoles must be text')
+        if not slots:
+            raise ValueError(f'Signup type {name} has no slots')
+        if len({slot.emoji for slot in slots}) != len(slots):
+            raise ValueError(f'Signup type {name} uses the same emoji for two slots')
+        if any(slot.maxReact < -1 for slot in slots):
+            raise ValueError(f'Signup type {name}: slot limits must be -1 (unlimited) or more')
+        if any(argument not in SIGNUP_ARGUMENTS for argument in arguments):
+            raise ValueError(f'Signup type {name}: arguments must be from {SIGNUP_ARGUMENTS}')
+        if 'message' not in arguments and template not in templates.templates:
+            raise ValueError(f'Signup type {name} needs a template from messages/ or a message argument')
+
+        signUpTypes[name] = SignUpType(name,channel,template,arguments,mentionRoles,slots)
+    return signUpTypes
+
+
+signUpTypes = load_signup_types(SIGNUP_TYPES_PATH)
@@ -10,7 +10,9 @@ import os
 from datetime import datetime
 
 from discordbasics import channelManipulation
+import channellayout
 import settings
+import time
 import traceback
 
 
@@ -20,6 +22,8 @@ class opschannels(channelManipulation,commands.Cog):
     creation and destructioin routines for voice channels in discord
     """
     def __init__(self,bot):
+        # channelManipulation sets self.bot to None, so this goes first
+        super().__init__()
         self.platoon_setup ={'Headquarters':['Command'],'Standard':['Alpha','Bravo','Charlie','Delta'],'Specialist':['SoberDogs A','SoberDogs B','ArmourDogs','Royal Air Woof','DogFighters','LogiDogs']}    
         self.school={'School':['Headteachers Office']}
         self.members = []
@@ -27,7 +31,6 @@ class opschannels(channelManipulation,commands.Cog):
         self.starttime = None
         self.bot = bot
         self.lock = asyncio.Lock()
-        super().__init__()
         
         
     @commands.command(name='ps2-start-ops')
@@ -48,51 +51,57 @@ class opschannels(channelManipulation,commands.Cog):
             except:
                 traceback.print_exc()
                 
-            
-            for category_name in self.platoon_setup.keys():
-                try:
-                    await channelManipulation.create_category(ctx,category_name,overwrites=overwrites)
-                except:
-                    traceback.print_exc()
-                existing_category = discord.utils.get(ctx.guild.categories,
-                                                      name=category_name)
-
-                if existing_category:
-                    #
-                    # Fill categories with voice channels
-                    #
-                    for channel_name in self.platoon_setup[category_name]:
-                        await channelManipulation.create_voice_channel(
-                            ctx,
-                            channel_name,
-                            existing_category) 
+            await self.reconcile(ctx,self.platoon_setup,overwrites)
 
         print('Platoon creation complete')
-        
+
+
+    async def reconcile(self,ctx,layout,overwrites=None,remove=()):
+        """
+        Brings the guild's channels in line with layout
+        ({category name : [channel names]}), changing only what differs,
+        and posts what was done and how long it took
+        """
+        startTime = time.perf_counter()
+        steps = channellayout.plan_layout(ctx.guild,layout,overwrites,remove)
+        result = await channellayout.apply_layout(ctx.guild,steps,self.bot.restBudget,overwrites,self.holding_channel(ctx,layout,remove))
+        lines = [f'{", ".join(layout.keys()) or ", ".join(remove)}: {result.text()} in {time.perf_counter()-startTime:.1f}s']
+        await ctx.send('\n'.join(lines + result.problems()))
+        return result
+
+
+    def holding_channel(self,ctx,layout,remove):
+        """
+        The OPS_HOLDING_CHANNEL voice channel, unless it is
+        in one of the categories being changed
+        """
+        if not settings.OPS_HOLDING_CHANNEL:
+            return None
+        holding = discord.utils.get(ctx.guild.voice_channels,name=settings.OPS_HOLDING_CHANNEL)
+        if holding is None or (holding.category is not None and (holding.category.name in layout or holding.category.name in remove)):
+            return None
+        return holding
+
     @commands.command(name='ps2-end-ops')
     async def destroy_plt(self,ctx):
         """
-        Destroy ops channels 
+        Destroy ops channels. Anyone still in them is moved to
+        OPS_HOLDING_CHANNEL, or the channel is left until it is empty
         """
         
         print('Attempting to end ops')
-        existing_categories = ctx.guild.categories
-        for cat in existing_categories:
-            if cat.name in self.platoon_setup.keys():
-                channels = cat.voice_channels
-                for channel in channels:
-                    await channelManipulation.delete_voice_channel(
-                        ctx,channel,
-                        category=cat)
-                await channelManipulation.delete_category(ctx,cat)
+        async with self.lock:
+            result = await self.reconcile(ctx,{},remove=self.platoon_setup.keys())
         print('Delete complete')
+        return result
         
         
     @commands.command(name='ps2-start-school')
     async def start_school(self,ctx,arg):        
         """
         Usage: !ps2-start-school <numberOfClassrooms>
-        Creates <numberOfClassrooms> channels, and one "headteacher" channel
+        Creates <numberOfClassrooms> channels, and one "headteacher" channel.
+        Running it again while school is open adds or removes classrooms
         """
         async with self.lock:
             print('School Opening')
@@ -102,20 +111,7 @@ class opschannels(channelManipulation,commands.Cog):
 
             self.school = {'School':self.schoolrooms}
 
-            for category_name in self.school.keys():
-                await channelManipulation.create_category(ctx,category_name)
-                existing_category = discord.utils.get(ctx.guild.categories,
-                                                      name=category_name)
-
-                if existing_category:
-                    #
-                    # Fill categories with voice channels
-                    #
-                    for channel_name in self.school[category_name]:
-                        await channelManipulation.create_voice_channel(
-                            ctx,
-                            channel_name,
-                            existing_category) 
+            await self.reconcile(ctx,self.school)
 
         print('School Open')
     
@@ -123,20 +119,15 @@ class opschannels(channelManipulation,commands.Cog):
     async def end_school(self,ctx):
         """
         Usage: !ps2-end-school
-        Destroys all school channels
+        Destroys all school channels. Anyone still in them is moved to
+        OPS_HOLDING_CHANNEL, or the channel is left until it is empty
         """
         
         print('School Closing')
-        existing_categories = ctx.guild.categories
-        for cat in existing_categories:
-            if cat.name in self.school.keys():
-                channels = cat.voice_channels
-                for channel in channels:
-                    await channelManipulation.delete_voice_channel(
-                        ctx,channel,
-                        category=cat)
-                await channelManipulation.delete_category(ctx,cat)
+        async with self.lock:
+            result = await self.reconcile(ctx,{},remove=self.school.keys())
         print('School Closed')
+        return result
         
         
     """
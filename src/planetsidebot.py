@@ -17,19 +17,47 @@ import opstart
 import settings
 import opsignup
 import chatlinker
+import ratelimit
+import guildcache
 import bullybully
 #import outfittracking
 
 class Bot(commands.Bot):
 
     def __init__(self):
-        super(Bot, self).__init__(command_prefix=['!'])
+        intents = discord.Intents.default()
+        # From discord.py 2.0, prefix commands need message content
+        # asked for explicitly (signup buttons also need 2.0)
+        if hasattr(intents,'message_content'):
+            intents.message_content = True
+        super(Bot, self).__init__(command_prefix=['!'],intents=intents)
 
-        self.add_cog(opstart.opschannels(self))
-        self.add_cog(opsignup.OpSignUp(self))
-        self.add_cog(chatlinker.ChatLinker(self))
-        #self.add_cog(bullybully.Bully(self))
-        #self.add_cog(outfittracking.PS2OutfitTracker(self))
+        # Shared by every cog, so bursts from different commands
+        # still add up to one budget
+        self.restBudget = ratelimit.RateBudget(settings.REST_INTERVAL,settings.REST_CONCURRENCY)
+
+        # discord.py 2.0 adds cogs with an awaited add_cog, from setup_hook
+        if discord.version_info.major < 2:
+            for cog in self.make_cogs():
+                self.add_cog(cog)
+
+    def make_cogs(self):
+        return [guildcache.GuildCache(self),
+                opstart.opschannels(self),
+                opsignup.OpSignUp(self),
+                chatlinker.ChatLinker(self)]
+                #bullybully.Bully(self)
+                #outfittracking.PS2OutfitTracker(self)
+
+    async def setup_hook(self):
+        for cog in self.make_cogs():
+            await self.add_cog(cog)
+
+    async def close(self):
+        for cog in list(self.cogs.values()):
+            if hasattr(cog,'shutdown'):
+                await cog.shutdown()
+        await super().close()
 
     async def on_ready(self):
         print(f'Logged in as {self.user.name} | {self.user.id} on Guild {settings.DISCORD_GUILD}')
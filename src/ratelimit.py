@@ -0,0 +1,48 @@
+import asyncio
+
+
+class RateBudget():
+    """
+    Spaces out REST calls so bursts stay inside discord's rate limits,
+    rather than relying on 429 responses to slow us down.
+
+    At most `concurrency` calls are in flight at once, and calls are
+    started no closer together than `interval` seconds.
+
+    Usage:
+        async with budget:
+            await channel.send(...)
+    or
+        await budget.call(channel.send, ...)
+    """
+    def __init__(self,interval,concurrency):
+        self.interval = interval
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.lock = asyncio.Lock()
+        self.nextStart = 0.0
+        self.calls = 0
+
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        try:
+            async with self.lock:
+                now = asyncio.get_event_loop().time()
+                if self.nextStart > now:
+                    await asyncio.sleep(self.nextStart - now)
+                    now = self.nextStart
+                self.nextStart = now + self.interval
+        except BaseException:
+            self.semaphore.release()
+            raise
+        self.calls += 1
+        return self
+
+
+    async def __aexit__(self,excType,exc,tb):
+        self.semaphore.release()
+
+
+    async def call(self,function,*args,**kwargs):
+        async with self:
+            return await function(*args,**kwargs)
@@ -10,4 +10,67 @@ DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 DISCORD_GUILD = os.getenv('DISCORD_GUILD')
 PS2_SVS_ID = os.getenv('PS2_SVS_ID')
 
+# Shared REST budget: seconds between calls, and calls in flight at once
+REST_INTERVAL = float(os.getenv('REST_INTERVAL', '0.25'))
+REST_CONCURRENCY = int(os.getenv('REST_CONCURRENCY', '4'))
+
+# Seconds to collect signup changes before editing the embed
+SIGNUP_RENDER_WINDOW = float(os.getenv('SIGNUP_RENDER_WINDOW', '2'))
+
+# Seconds between checks for edited files in messages/
+TEMPLATE_RELOAD_INTERVAL = float(os.getenv('TEMPLATE_RELOAD_INTERVAL', '30'))
+
+# How people sign up: 'reactions', 'buttons' or 'both'.
+# Buttons need discord.py 2.0, reactions are used if it is missing.
+SIGNUP_TRANSPORT = os.getenv('SIGNUP_TRANSPORT', 'reactions')
+
+# Number of sheets !ps2-schedule posts at once
+SIGNUP_SCHEDULE_CONCURRENCY = int(os.getenv('SIGNUP_SCHEDULE_CONCURRENCY', '4'))
+
+# Signup sheets are kept in this sqlite file between restarts
+SIGNUP_DB = os.getenv('SIGNUP_DB', 'signups.db')
+SIGNUP_FLUSH_INTERVAL = float(os.getenv('SIGNUP_FLUSH_INTERVAL', '1'))
+
+# Sheets are archived this many hours after their start time. Sheets
+# without a start time we can read are archived SIGNUP_MAX_AGE hours
+# after they were posted. Checked every SIGNUP_ARCHIVE_INTERVAL seconds.
+SIGNUP_ARCHIVE_GRACE = float(os.getenv('SIGNUP_ARCHIVE_GRACE', '12')) * 3600
+SIGNUP_MAX_AGE = float(os.getenv('SIGNUP_MAX_AGE', '336')) * 3600
+SIGNUP_ARCHIVE_INTERVAL = float(os.getenv('SIGNUP_ARCHIVE_INTERVAL', '3600'))
+
+# Number of signup messages read at once when catching up after a restart
+SIGNUP_RECONCILE_CONCURRENCY = int(os.getenv('SIGNUP_RECONCILE_CONCURRENCY', '4'))
+
+# Seconds to collect chat channel member changes before writing them
+CHAT_PERMISSION_WINDOW = float(os.getenv('CHAT_PERMISSION_WINDOW', '1'))
+
+# Linked chat channels kept hidden and ready for reuse. At least
+# CHAT_POOL_SIZE spares are kept, at most CHAT_POOL_MAX, and spares
+# idle for more than CHAT_POOL_IDLE seconds are deleted down to
+# CHAT_POOL_SIZE, checked every CHAT_POOL_INTERVAL seconds
+CHAT_POOL_SIZE = int(os.getenv('CHAT_POOL_SIZE', '2'))
+CHAT_POOL_MAX = int(os.getenv('CHAT_POOL_MAX', '6'))
+CHAT_POOL_IDLE = float(os.getenv('CHAT_POOL_IDLE', '3600'))
+CHAT_POOL_INTERVAL = float(os.getenv('CHAT_POOL_INTERVAL', '300'))
+
+# Released chats with more messages than this (at most 100, one bulk
+# delete) are deleted rather than wiped and kept as spares
+CHAT_POOL_RECYCLE_MESSAGES = int(os.getenv('CHAT_POOL_RECYCLE_MESSAGES', '50'))
+
+# A linked chat is made once a VC has CHAT_CREATE_OCCUPANCY members, or
+# someone has stayed in it for CHAT_CREATE_DWELL seconds. Empty VCs keep
+# their chat for CHAT_TEARDOWN_GRACE seconds in case someone comes back
+CHAT_CREATE_DWELL = float(os.getenv('CHAT_CREATE_DWELL', '10'))
+CHAT_CREATE_OCCUPANCY = int(os.getenv('CHAT_CREATE_OCCUPANCY', '2'))
+CHAT_TEARDOWN_GRACE = float(os.getenv('CHAT_TEARDOWN_GRACE', '60'))
+
+# Where the voice -> chat channel links are kept between restarts, and
+# how many chats the startup sweep adopts or releases at once
+CHAT_DB = os.getenv('CHAT_DB', 'chats.db')
+CHAT_SWEEP_CONCURRENCY = int(os.getenv('CHAT_SWEEP_CONCURRENCY', '4'))
+
+# Voice channel that people are moved to when the ops or school channels
+# they are in are torn down. If unset, occupied channels are left alone
+OPS_HOLDING_CHANNEL = os.getenv('OPS_HOLDING_CHANNEL', '')
+
 print("Tokens loaded")
\ No newline at end of file
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import sqlite3
+import time
+import traceback
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SignUpStore():
+    """
+    Keeps signup sheets on disk so they survive a restart.
+
+    Every sheet has a snapshot of its full state, plus a journal of the
+    changes (add, remove, limit) made since that snapshot. Changes are
+    queued in memory and written in batches by a single worker thread,
+    so the event loop never waits on the disk.
+
+    Once a sheet has built up compactEvery journal entries, a fresh
+    snapshot is written and its journal entries are dropped.
+
+    Sheets that are finished with can be archived: their state is
+    compressed into the archive table and they are no longer loaded
+    on startup. unarchive() reads one back when it is needed again.
+    The archive keeps each sheet's type and date uncompressed, so we
+    can tell what has been posted without reading the sheets back.
+    """
+    def __init__(self,path,flushInterval=1.0,compactEvery=50):
+        self.path = path
+        self.flushInterval = flushInterval
+        self.compactEvery = compactEvery
+
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = [] # [(op, message_id, data)]
+        self.journalCounts = {} # {message_id : entries since last snapshot}
+        self.flushTask = None
+
+
+    def open_database(self):
+        """
+        Runs on the worker thread
+        """
+        self.connection = sqlite3.connect(self.path,check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS snapshots (message_id INTEGER PRIMARY KEY, seq INTEGER NOT NULL, state TEXT NOT NULL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS journal (seq INTEGER PRIMARY KEY AUTOINCREMENT, message_id INTEGER NOT NULL, op TEXT NOT NULL, data TEXT NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS journal_message ON journal (message_id)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS archive (message_id INTEGER PRIMARY KEY, state BLOB NOT NULL, signup_type TEXT, date TEXT)')
+
+        # Archives written before the type and date were kept
+        if 'signup_type' not in {row[1] for row in self.connection.execute('PRAGMA table_info(archive)')}:
+            self.connection.execute('ALTER TABLE archive ADD COLUMN signup_type TEXT')
+            self.connection.execute('ALTER TABLE archive ADD COLUMN date TEXT')
+            for messageID, state in self.connection.execute('SELECT message_id, state FROM archive').fetchall():
+                state = json.loads(zlib.decompress(state))
+                self.connection.execute('UPDATE archive SET signup_type = ?, date = ? WHERE message_id = ?',
+                                        (state['signUpType'],state.get('date'),messageID))
+        self.connection.commit()
+
+
+    async def run(self,function,*args):
+        return await asyncio.get_event_loop().run_in_executor(self.executor,function,*args)
+
+
+    async def start(self):
+        """
+        Opens the database and starts the background writer
+        """
+        await self.run(self.open_database)
+        if self.flushTask is None:
+            self.flushTask = asyncio.get_event_loop().create_task(self.flush_loop())
+
+
+    async def close(self):
+        if self.flushTask is not None:
+            self.flushTask.cancel()
+            self.flushTask = None
+        await self.flush()
+        if self.connection is not None:
+            await self.run(self.connection.close)
+            self.connection = None
+
+
+    def save(self,obj):
+        """
+        Queue a full snapshot of obj. This replaces its journal.
+        """
+        self.journalCounts[obj.messageHandlerID] = 0
+        self.pending.append(('snapshot',obj.messageHandlerID,json.dumps(obj.to_state())))
+
+
+    def record(self,obj,op,data):
+        """
+        Queue a journal entry for a change already applied to obj
+        """
+        count = self.journalCounts.get(obj.messageHandlerID,0) + 1
+        if count >= self.compactEvery:
+            self.save(obj)
+        else:
+            self.journalCounts[obj.messageHandlerID] = count
+            self.pending.append(('journal',obj.messageHandlerID,json.dumps(data|{'op':op})))
+
+
+    def archive(self,obj):
+        """
+        Queue obj to be moved out of the live tables into the archive
+        """
+        self.journalCounts.pop(obj.messageHandlerID,None)
+        self.pending.append(('archive',obj.messageHandlerID,(zlib.compress(json.dumps(obj.to_state()).encode()),obj.signUpType,obj.date)))
+
+
+    def delete(self,messageID):
+        self.journalCounts.pop(messageID,None)
+        self.pending.append(('delete',messageID,None))
+
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flushInterval)
+            try:
+                await self.flush()
+            except Exception:
+                traceback.print_exc()
+
+
+    async def flush(self):
+        if not self.pending or self.connection is None:
+            return
+        batch = self.pending
+        self.pending = []
+        await self.run(self.write_batch,batch)
+
+
+    def write_batch(self,batch):
+        """
+        Runs on the worker thread. The whole batch is one transaction
+        """
+        with self.connection:
+            for op, messageID, data in batch:
+                if op == 'journal':
+                    self.connection.execute('INSERT INTO journal (message_id, op, data) VALUES (?,?,?)',
+                                            (messageID,json.loads(data)['op'],data))
+                elif op == 'snapshot':
+                    seq = self.connection.execute('SELECT COALESCE(MAX(seq),0) FROM journal').fetchone()[0]
+                    self.connection.execute('INSERT OR REPLACE INTO snapshots (message_id, seq, state) VALUES (?,?,?)',
+                                            (messageID,seq,data))
+                    self.connection.execute('DELETE FROM journal WHERE message_id = ? AND seq <= ?',(messageID,seq))
+                    self.connection.execute('DELETE FROM archive WHERE message_id = ?',(messageID,))
+                elif op == 'archive':
+                    self.connection.execute('INSERT OR REPLACE INTO archive (message_id, state, signup_type, date) VALUES (?,?,?,?)',(messageID,*data))
+                    self.connection.execute('DELETE FROM snapshots WHERE message_id = ?',(messageID,))
+                    self.connection.execute('DELETE FROM journal WHERE message_id = ?',(messageID,))
+                elif op == 'delete':
+                    self.connection.execute('DELETE FROM snapshots WHERE message_id = ?',(messageID,))
+                    self.connection.execute('DELETE FROM journal WHERE message_id = ?',(messageID,))
+                    self.connection.execute('DELETE FROM archive WHERE message_id = ?',(messageID,))
+
+
+    def read_all(self):
+        """
+        Runs on the worker thread.
+        Returns {message_id : [state, [journal entries]]}
+        """
+        sheets = {}
+        seqs = {}
+        for messageID, seq, state in self.connection.execute('SELECT message_id, seq, state FROM snapshots'):
+            sheets[messageID] = [json.loads(state),[]]
+            seqs[messageID] = seq
+
+        for messageID, seq, data in self.connection.execute('SELECT message_id, seq, data FROM journal ORDER BY seq'):
+            if messageID in sheets and seq > seqs[messageID]:
+                sheets[messageID][1].append(json.loads(data))
+        return sheets
+
+
+    async def load(self):
+        """
+        Reads every stored sheet, returning
+        {message_id : [state, [journal entries]]}
+        """
+        startTime = time.perf_counter()
+        sheets = await self.run(self.read_all)
+        entries = sum(len(journal) for state, journal in sheets.values())
+        for messageID, (state, journal) in sheets.items():
+            self.journalCounts[messageID] = len(journal)
+        print(f'Read {len(sheets)} signups and {entries} journal entries in {time.perf_counter()-startTime:.3f}s')
+        return sheets
+
+
+    def read_archived(self):
+        return {messageID : (signUpType,date) for messageID, signUpType, date
+                in self.connection.execute('SELECT message_id, signup_type, date FROM archive')}
+
+
+    async def archived(self):
+        """
+        Returns {message_id : (signup type, date)} of the archived sheets
+        """
+        return await self.run(self.read_archived)
+
+
+    def read_archived_state(self,messageID):
+        row = self.connection.execute('SELECT state FROM archive WHERE message_id = ?',(messageID,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+
+    async def unarchive(self,messageID):
+        """
+        Returns the archived state of a sheet, or None.
+        The archive entry is only removed once the sheet
+        is saved again, so nothing is lost if we stop in between.
+        """
+        await self.flush()
+        return await self.run(self.read_archived_state,messageID)
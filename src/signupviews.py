@@ -0,0 +1,45 @@
+import discord
+
+
+# Buttons need discord.ui, which only exists from discord.py 2.0
+COMPONENTS_AVAILABLE = hasattr(discord,'ui')
+
+CUSTOM_ID_PREFIX = 'signup:'
+LEAVE_KEY = 'leave'
+
+
+def build_sign_up_view(obj):
+    """
+    Returns a view with one button per reaction of the signup,
+    plus a leave button, or None if buttons are not available.
+
+    The buttons have no callbacks of their own. Clicks are picked up
+    by OpSignUp from on_interaction using the custom_id, so they keep
+    working after a restart without registering a view per sheet.
+    """
+    if not COMPONENTS_AVAILABLE:
+        return None
+
+    view = discord.ui.View(timeout=None)
+    for key, reaction in obj.reactions.items():
+        view.add_item(discord.ui.Button(label=reaction.name,
+                                        emoji=discord.PartialEmoji.from_str(reaction.symbol),
+                                        custom_id=f'{CUSTOM_ID_PREFIX}{key}',
+                                        style=discord.ButtonStyle.secondary))
+    view.add_item(discord.ui.Button(label='Leave',
+                                    custom_id=f'{CUSTOM_ID_PREFIX}{LEAVE_KEY}',
+                                    style=discord.ButtonStyle.danger))
+    return view
+
+
+def sign_up_key(interaction):
+    """
+    Returns the reaction key (or LEAVE_KEY) of a signup button
+    click, or None if the interaction is something else
+    """
+    if interaction.type != discord.InteractionType.component:
+        return None
+    customID = (interaction.data or {}).get('custom_id','')
+    if not customID.startswith(CUSTOM_ID_PREFIX):
+        return None
+    return customID[len(CUSTOM_ID_PREFIX):]
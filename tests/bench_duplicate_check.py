@@ -0,0 +1,82 @@
+"""
+Cost of the signup checks on large open sheets (Training and NCAF,
+whose slots are unlimited), as the number of people signed up grows:
+
+    python tests/bench_duplicate_check.py [--members 100 1000 10000] [--repeat 20000]
+
+dup check    signed_up_to(), the reverse index lookup
+scan check   the duplicate check the index replaced, a check_member
+             over every slot
+dup add      add_signup() refused because the user is already on
+move         remove_signup() then add_signup() on another slot
+join/leave   add_signup() and remove_signup() for a new user
+
+Times are microseconds per operation, and should not grow with members.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+
+from opsignupclasses import SignUpSheet, signUpTypes
+
+
+def filled_sheet(signup,members):
+    obj = SignUpSheet(signUpTypes[signup],SimpleNamespace(id=1),'Benchmark','Benchmark sheet')
+    slots = list(obj.reactions.keys())
+    for userID in range(members):
+        obj.add_signup(str(userID),slots[userID % len(slots)],f'<@{userID}>\n')
+    return obj, slots
+
+
+def measure(signup,members,repeat):
+    obj, slots = filled_sheet(signup,members)
+    userID = str(members // 2)
+    current = obj.signed_up_to(userID)
+    other = next(slot for slot in slots if slot != current)
+    newID = str(members)
+
+    def scan_check():
+        return sum([obj.reactions[react].check_member(userID) for react in obj.reactions])
+
+    def move():
+        obj.remove_signup(userID,current)
+        obj.add_signup(userID,other,'')
+        obj.remove_signup(userID,other)
+        obj.add_signup(userID,current,'')
+
+    def join_leave():
+        obj.add_signup(newID,current,'')
+        obj.remove_signup(newID,current)
+
+    timings = {'dup check' : (lambda: obj.signed_up_to(userID),1),
+               'scan check' : (scan_check,1),
+               'dup add' : (lambda: obj.add_signup(userID,other,''),1),
+               'move' : (move,2),
+               'join/leave' : (join_leave,1)}
+    return {name : min(timeit.repeat(function,number=repeat,repeat=3))/repeat/count*1e6
+            for name, (function, count) in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members',type=int,nargs='+',default=[100,1000,10000])
+    parser.add_argument('--repeat',type=int,default=20000)
+    args = parser.parse_args()
+
+    names = ['dup check','scan check','dup add','move','join/leave']
+    print(f'{"sheet":>9} {"members":>8} ' + ' '.join(f'{name:>11}' for name in names))
+    for signup in ('training','ncaf'):
+        for members in args.members:
+            with contextlib.redirect_stdout(io.StringIO()):
+                timings = measure(signup,members,args.repeat)
+            print(f'{signup:>9} {members:>8} ' + ' '.join(f'{timings[name]:>11.3f}' for name in names))
+
+
+if __name__ == '__main__':
+    main()
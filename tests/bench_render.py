@@ -0,0 +1,75 @@
+"""
+Cost of one signup or unreact on a long roster, including bringing the
+embed up to date, as the number of people signed up to one slot grows:
+
+    python tests/bench_render.py [--members 100 1000 10000] [--repeat 2000]
+
+join      add_signup() for a new user, then render_embed()
+leave     remove_signup() of someone from the second half of the
+          list, then render_embed()
+render    render_embed() with nothing changed
+
+Times are microseconds per event, and should not grow with members.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import os
+import sys
+import timeit
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+
+from gateway import Gateway
+from test_removal_ledger import make_cog, post_sheet
+
+
+def measure(members,repeat):
+    gateway = Gateway()
+    obj = asyncio.run(post_sheet(make_cog(gateway),gateway,'training','Benchmark','Benchmark sheet'))
+    slot = next(iter(obj.reactions))
+    for userID in range(members):
+        obj.add_signup(str(userID),slot,f'<@{100000000000000000+userID}>\n')
+    obj.render_embed()
+
+    leaving = itertools.cycle([str(userID) for userID in range(members // 2,members)])
+    newID = str(members)
+
+    def join():
+        obj.add_signup(newID,slot,f'<@{newID}>\n')
+        obj.render_embed()
+        obj.remove_signup(newID,slot)
+        obj.render_embed()
+
+    def leave():
+        userID = next(leaving)
+        userNameText = obj.reactions[slot].members[userID]
+        obj.remove_signup(userID,slot)
+        obj.render_embed()
+        obj.add_signup(userID,slot,userNameText)
+        obj.render_embed()
+
+    # join and leave each time two events
+    return {'join' : min(timeit.repeat(join,number=repeat,repeat=3))/repeat/2*1e6,
+            'leave' : min(timeit.repeat(leave,number=repeat,repeat=3))/repeat/2*1e6,
+            'render' : min(timeit.repeat(obj.render_embed,number=repeat,repeat=3))/repeat*1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members',type=int,nargs='+',default=[100,1000,10000])
+    parser.add_argument('--repeat',type=int,default=2000)
+    args = parser.parse_args()
+
+    names = ['join','leave','render']
+    print(f'{"members":>8} ' + ' '.join(f'{name:>9}' for name in names))
+    for members in args.members:
+        with contextlib.redirect_stdout(io.StringIO()):
+            timings = measure(members,args.repeat)
+        print(f'{members:>8} ' + ' '.join(f'{timings[name]:>9.1f}' for name in names))
+
+
+if __name__ == '__main__':
+    main()
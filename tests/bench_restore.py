@@ -0,0 +1,81 @@
+"""
+Startup restore time against the number of stored signup sheets.
+Each sheet gets --journal signups written as journal entries after its
+snapshot, with their reactions on the gateway stand-in's messages, and
+the database is then restored by a fresh OpSignUp:
+
+    python tests/bench_restore.py [--sheets 100 1000 5000] [--journal 20]
+
+rebuild     restore_sign_ups up to objDict being filled: reading the
+            store, from_state and replaying the journals
+reconcile   checking every sheet against the reactions on its message,
+            with no REST latency
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+
+from opsignup import OpSignUp
+from signupstore import SignUpStore
+
+from gateway import Gateway
+from test_removal_ledger import make_cog, post_sheet
+
+
+async def restore(path,sheets,journal):
+    gateway = Gateway()
+    cog = make_cog(gateway)
+    cog.store = SignUpStore(path)
+    await cog.store.start()
+    for i in range(sheets):
+        obj = await post_sheet(cog,gateway,'training','Galaxy drop training','Bring a galaxy')
+        emojis = list(obj.reactions.keys())
+        for userID in range(journal):
+            emoji = emojis[userID % len(emojis)]
+            obj.add_signup(str(userID),emoji,f'<@{userID}>\n')
+            cog.update_data_entry(obj,'add',{'user':str(userID),'emoji':emoji,'text':f'<@{userID}>\n'})
+            gateway.place(obj.messageHandlerID,userID,emoji)
+    await cog.store.close()
+
+    restarted = make_cog(gateway)
+    restarted.store = SignUpStore(path)
+    async def skip():
+        pass
+    restarted.reconcile_sign_ups = skip
+    startTime = time.perf_counter()
+    await restarted.restore_sign_ups()
+    rebuild = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    await OpSignUp.reconcile_sign_ups(restarted)
+    reconcile = time.perf_counter() - startTime
+
+    assert len(restarted.objDict) == sheets
+    assert all(len(obj.memberIndex) == journal for obj in restarted.objDict.values())
+    await restarted.shutdown()
+    return rebuild, reconcile
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sheets',type=int,nargs='+',default=[100,1000,5000])
+    parser.add_argument('--journal',type=int,default=20)
+    args = parser.parse_args()
+
+    print(f'{"sheets":>6} {"rebuild s":>10} {"per sheet ms":>13} {"reconcile s":>12}')
+    for sheets in args.sheets:
+        with tempfile.TemporaryDirectory() as directory:
+            with contextlib.redirect_stdout(io.StringIO()):
+                rebuild, reconcile = asyncio.run(restore(os.path.join(directory,'signups.db'),sheets,args.journal))
+        print(f'{sheets:>6} {rebuild:>10.3f} {rebuild/sheets*1000:>13.3f} {reconcile:>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
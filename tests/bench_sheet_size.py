@@ -0,0 +1,92 @@
+"""
+Memory and construction cost of an empty signup sheet of each type,
+as built from its prototype in signuptypes.json and as rebuilt from
+a stored state on restart:
+
+    python tests/bench_sheet_size.py [--sheets 1000] [--repeat 2000]
+
+bytes        memory held per sheet (tracemalloc, over --sheets sheets)
+slot bytes   of which the ReactionData records
+new us       SignUpSheet(), microseconds per sheet
+restore us   SignUpSheet.from_state(), microseconds per sheet
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+
+from opsignupclasses import ReactionData, SignUpSheet, signUpTypes
+
+from gateway import Gateway
+from test_removal_ledger import make_cog, post_sheet
+
+
+CHANNEL = SimpleNamespace(id=1)
+
+
+def arguments(signUpType):
+    values = {'opsType' : 'Benchmark', 'message' : 'Benchmark sheet', 'additionalRoles' : ''}
+    return [values[argument] for argument in signUpType.arguments]
+
+
+def held_bytes(build,sheets):
+    """
+    Bytes still allocated per object after building sheets of them
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    built = [build() for i in range(sheets)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    held = sum(stat.size_diff for stat in after.compare_to(before,'filename'))
+    del built
+    return held/sheets
+
+
+def posted_state(signUpType):
+    """
+    The stored state of a sheet of signUpType once it is posted
+    """
+    gateway = Gateway()
+    obj = asyncio.run(post_sheet(make_cog(gateway),gateway,signUpType.name,*arguments(signUpType)))
+    return obj.to_state()
+
+
+def measure(signUpType,sheets,repeat):
+    args = arguments(signUpType)
+    new = lambda: SignUpSheet(signUpType,CHANNEL,*args)
+    state = posted_state(signUpType)
+    restore = lambda: SignUpSheet.from_state(state)
+    slot = signUpType.slots[0]
+    slotCount = len(signUpType.slots)
+
+    return {'slots' : slotCount,
+            'bytes' : held_bytes(new,sheets),
+            'slot bytes' : held_bytes(lambda: ReactionData(slot.name,slot.emoji,slot.maxReact),sheets)*slotCount,
+            'new us' : min(timeit.repeat(new,number=repeat,repeat=3))/repeat*1e6,
+            'restore us' : min(timeit.repeat(restore,number=repeat,repeat=3))/repeat*1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sheets',type=int,default=1000)
+    parser.add_argument('--repeat',type=int,default=2000)
+    args = parser.parse_args()
+
+    names = ['slots','bytes','slot bytes','new us','restore us']
+    print(f'{"sheet":>14} ' + ' '.join(f'{name:>11}' for name in names))
+    for name, signUpType in signUpTypes.items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = measure(signUpType,args.sheets,args.repeat)
+        print(f'{name:>14} {results["slots"]:>11} ' + ' '.join(f'{results[name]:>11.1f}' for name in names[1:]))
+
+
+if __name__ == '__main__':
+    main()
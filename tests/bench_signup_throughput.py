@@ -0,0 +1,69 @@
+"""
+Reaction throughput against the number of signup sheets being filled
+at once. Every sheet gets the same burst: each user reacts to a random
+slot, and some hit the closed MAX slot or a second slot and have their
+reaction taken off again, which costs a REST call under the sheet's
+lock. Each REST call takes --latency seconds.
+
+    python tests/bench_signup_throughput.py [--sheets 1 2 4 8 16] [--users 40] [--latency 0.05] [--one-lock]
+
+With a lock per sheet the time for a burst should stay roughly flat as
+sheets are added, so events/s grows with the number of sheets.
+--one-lock shares one lock between every sheet, as before, to compare.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','src'))
+
+from gateway import Gateway
+from test_removal_ledger import make_cog, post_sheet
+
+
+async def burst(sheets,users,latency,seed,oneLock):
+    rng = random.Random(seed)
+    gateway = Gateway(latency)
+    cog = make_cog(gateway)
+    cog.renderQueue.window = latency
+    if oneLock:
+        lock = asyncio.Lock()
+        cog.get_sign_up_lock = lambda messageID: lock
+    messageIDs = [(await post_sheet(cog,gateway)).messageHandlerID for i in range(sheets)]
+
+    emojis = list(cog.objDict[messageIDs[0]].reactions.keys())
+    for messageID in messageIDs:
+        for userID in range(1,users+1):
+            gateway.react(messageID,userID,rng.choice(emojis))
+            if rng.random() < 0.2:
+                gateway.react(messageID,userID,rng.choice(emojis))
+
+    startTime = time.perf_counter()
+    handled = await gateway.dispatch(cog)
+    await cog.renderQueue.flush_all()
+    elapsed = time.perf_counter() - startTime
+    return handled, elapsed, gateway.bot_removals, sum(message.edits for message in gateway.messages.values())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sheets',type=int,nargs='+',default=[1,2,4,8,16])
+    parser.add_argument('--users',type=int,default=40)
+    parser.add_argument('--latency',type=float,default=0.05)
+    parser.add_argument('--one-lock',action='store_true')
+    args = parser.parse_args()
+
+    print(f'{"sheets":>6} {"events":>7} {"seconds":>8} {"events/s":>9} {"removals":>9} {"edits":>6}')
+    for sheets in args.sheets:
+        with contextlib.redirect_stdout(io.StringIO()):
+            handled, elapsed, removals, edits = asyncio.run(burst(sheets,args.users,args.latency,sheets,args.one_lock))
+        print(f'{sheets:>6} {handled:>7} {elapsed:>8.3f} {handled/elapsed:>9.1f} {removals:>9} {edits:>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+A local stand-in for the discord gateway, enough to drive the
+OpSignUp reaction handlers with raw reaction payloads.
+
+It keeps the reactions actually on each message. User actions and the
+bot's own remove_reaction calls change them and queue the raw event
+discord would send, which deliver() hands to the cog in order. As on
+discord, removing a reaction that is no longer there sends no event.
+REST calls on the message take latency seconds.
+"""
+import asyncio
+import itertools
+from collections import deque
+from types import SimpleNamespace
+
+import discord
+
+
+BOT_ID = 797809584604446740
+
+
+class Member(SimpleNamespace):
+    def __init__(self,id):
+        super().__init__(id=id,mention=f'<@{id}>',roles=[])
+
+
+class Reaction():
+    def __init__(self,emoji,users):
+        self.emoji = emoji
+        self.members = users
+
+    async def users(self):
+        for user in self.members:
+            yield user
+
+
+class Message():
+    def __init__(self,gateway,channelID,id):
+        self.gateway = gateway
+        self.channelID = channelID
+        self.id = id
+        self.edits = 0
+
+    async def edit(self,embed=None):
+        self.edits += 1
+        await asyncio.sleep(self.gateway.latency)
+
+    @property
+    def reactions(self):
+        users = {}
+        for userID, emoji in sorted(self.gateway.onMessage.get(self.id,())):
+            users.setdefault(emoji,[]).append(Member(userID))
+        return [Reaction(emoji,members) for emoji, members in users.items()]
+
+    async def add_reaction(self,emoji):
+        await asyncio.sleep(self.gateway.latency)
+
+    async def remove_reaction(self,emoji,member):
+        self.gateway.bot_removals += 1
+        await asyncio.sleep(self.gateway.latency)
+        self.gateway.remove(self.id,member.id,str(emoji))
+
+
+class Channel():
+    def __init__(self,gateway,id):
+        self.gateway = gateway
+        self.id = id
+
+    async def send(self,content,embed=None,view=None):
+        await asyncio.sleep(self.gateway.latency)
+        message = Message(self.gateway,self.id,next(self.gateway.ids))
+        self.gateway.messages[message.id] = message
+        return message
+
+    def get_partial_message(self,messageID):
+        return self.gateway.messages[messageID]
+
+    async def fetch_message(self,messageID):
+        await asyncio.sleep(self.gateway.latency)
+        if messageID not in self.gateway.messages:
+            raise discord.errors.NotFound(SimpleNamespace(status=404,reason='Not Found'),'Unknown Message')
+        return self.gateway.messages[messageID]
+
+
+class Budget():
+    async def call(self,function,*args,**kwargs):
+        return await function(*args,**kwargs)
+
+
+class Gateway():
+    def __init__(self,latency=0):
+        self.latency = latency
+        self.ids = itertools.count(1000)
+        self.channel = Channel(self,next(self.ids))
+        self.messages = {}
+        self.reactions = set() # {(message_id, user_id, emoji)}
+        self.onMessage = {} # {message_id : {(user_id, emoji)}}
+        self.events = deque() # [(kind, payload)]
+        self.bot_removals = 0
+        # Every signup type is posted to the one channel
+        self.guildCache = SimpleNamespace(text_channel=lambda guild, name: self.channel,roles=lambda guild, words: [])
+        self.bot = SimpleNamespace(user=SimpleNamespace(id=BOT_ID),get_channel=self.get_channel,
+                                   get_cog=lambda name: self.guildCache,restBudget=Budget())
+        self.guild = SimpleNamespace(get_channel=self.get_channel)
+
+    def get_channel(self,channelID):
+        return self.channel if channelID == self.channel.id else None
+
+    def payload(self,messageID,userID,emoji):
+        return SimpleNamespace(message_id=messageID,channel_id=self.channel.id,user_id=userID,
+                               emoji=emoji,member=Member(userID))
+
+    def react(self,messageID,userID,emoji):
+        """
+        A user adds a reaction. Returns False if they already have it.
+        """
+        if (messageID,userID,emoji) in self.reactions:
+            return False
+        self.place(messageID,userID,emoji)
+        self.events.append(('add',self.payload(messageID,userID,emoji)))
+        return True
+
+    def place(self,messageID,userID,emoji):
+        """
+        Puts a reaction on a message without sending an event,
+        e.g. one made while the bot was offline
+        """
+        self.reactions.add((messageID,userID,emoji))
+        self.onMessage.setdefault(messageID,set()).add((userID,emoji))
+
+    def remove(self,messageID,userID,emoji):
+        """
+        A user, or the bot, removes a reaction
+        """
+        if (messageID,userID,emoji) not in self.reactions:
+            return False
+        self.reactions.discard((messageID,userID,emoji))
+        self.onMessage[messageID].discard((userID,emoji))
+        self.events.append(('remove',self.payload(messageID,userID,emoji)))
+        return True
+
+    async def deliver(self,cog,count=None):
+        """
+        Hands up to count queued events (all, by default) to the cog.
+        Events the cog causes are queued behind those already waiting.
+        """
+        while self.events and (count is None or count > 0):
+            kind, payload = self.events.popleft()
+            if kind == 'add':
+                await cog.react_sign_up_check(payload)
+            else:
+                await cog.react_remove_sign_up_check(payload)
+            if count is not None:
+                count -= 1
+
+    async def dispatch(self,cog):
+        """
+        Hands every queued event to the cog at once, as discord.py runs
+        each listener call as its own task, until none are left.
+        Returns the number of events handled.
+        """
+        handled = 0
+        while self.events:
+            events = list(self.events)
+            self.events.clear()
+            await asyncio.gather(*(cog.react_sign_up_check(payload) if kind == 'add' else cog.react_remove_sign_up_check(payload)
+                                   for kind, payload in events))
+            handled += len(events)
+        return handled
+
+    def on_message(self,messageID):
+        """
+        {(user_id, emoji)} of the reactions on the message
+        """
+        return set(self.onMessage.get(messageID,()))
@@ -0,0 +1,187 @@
+import asyncio
+import inspect
+import itertools
+from types import SimpleNamespace
+
+import discord
+
+import channellayout
+from channellayout import apply_layout, plan_layout, position_payload
+
+
+class Channel():
+    def __init__(self,guild,name,position,categoryID):
+        self.guild = guild
+        self.id = next(guild.ids)
+        self.name = name
+        self.position = position
+        self.category_id = categoryID
+        self.members = []
+
+    async def delete(self):
+        self.guild.channels.remove(self)
+
+    async def edit(self,position=None,category=None):
+        """
+        As discord.py's channel.edit: position is compared against every
+        voice channel in the guild, which are then all renumbered
+        """
+        self.guild.edits += 1
+        channels = sorted((channel for channel in self.guild.channels if channel is not self),key=lambda c: c.position)
+        index = next((i for i, channel in enumerate(channels) if channel.position >= position),len(channels))
+        channels.insert(index,self)
+        for number, channel in enumerate(channels):
+            channel.position = number
+        if category is not None:
+            self.category_id = category.id
+
+
+class Category():
+    def __init__(self,guild,name,position):
+        self.guild = guild
+        self.id = next(guild.ids)
+        self.name = name
+        self.position = position
+        self.overwrites = {}
+
+    @property
+    def voice_channels(self):
+        # Channels only show up once their gateway event would have arrived
+        return sorted((channel for channel in self.guild.channels if channel.category_id == self.id and channel.id in self.guild.cached),
+                      key=lambda channel: (channel.position,channel.id))
+
+    async def delete(self):
+        self.guild.categoryList.remove(self)
+
+
+class Guild():
+    """
+    Keeps raw positions the way discord does: one numbering across
+    every voice channel, sorted within each category
+    """
+    def __init__(self,layout):
+        self.ids = itertools.count(100)
+        self.id = next(self.ids)
+        self.channels = []
+        self.categoryList = []
+        self.cached = set()
+        self.bulkCalls = []
+        self.edits = 0
+        self._state = SimpleNamespace(http=SimpleNamespace(bulk_channel_update=self.bulk_channel_update))
+        for categoryName, channelNames in layout.items():
+            category = Category(self,categoryName,len(self.categoryList))
+            self.categoryList.append(category)
+            for name in channelNames:
+                self.add_channel(name,len(self.channels),category)
+
+    def add_channel(self,name,position,category):
+        channel = Channel(self,name,position,category.id)
+        self.channels.append(channel)
+        self.cached.add(channel.id)
+        return channel
+
+    @property
+    def categories(self):
+        return sorted(self.categoryList,key=lambda category: category.position)
+
+    def get_channel(self,channelID):
+        return next((channel for channel in self.channels + self.categoryList if channel.id == channelID),None)
+
+    async def create_category(self,name,overwrites=None):
+        category = Category(self,name,len(self.categoryList))
+        self.categoryList.append(category)
+        return category
+
+    async def create_voice_channel(self,name,category=None,position=None):
+        channel = self.add_channel(name,position,category)
+        self.cached.discard(channel.id)
+        return channel
+
+    async def bulk_channel_update(self,guildID,payload):
+        assert guildID == self.id
+        self.bulkCalls.append(payload)
+        for entry in payload:
+            channel = self.get_channel(entry['id'])
+            channel.position = entry['position']
+            if 'parent_id' in entry:
+                channel.category_id = entry['parent_id']
+
+    def layout(self):
+        return {category.name : [channel.name for channel in sorted((channel for channel in self.channels if channel.category_id == category.id),
+                                                                     key=lambda channel: (channel.position,channel.id))]
+                for category in self.categories}
+
+
+OPS = {'Ops' : ['Alpha','Bravo','Charlie'], 'School' : ['Headteachers Office','Classroom 1','Classroom 2']}
+
+
+def reconcile(guild,layout):
+    steps = plan_layout(guild,layout)
+    result = asyncio.run(apply_layout(guild,steps,None))
+    assert result.failed == []
+    return result
+
+
+def test_bulk_update_matches_discord_py():
+    signature = inspect.signature(discord.http.HTTPClient.bulk_channel_update)
+    signature.bind(None,1,[{'id' : 2, 'position' : 0, 'parent_id' : 3}])
+
+
+def test_payload_reuses_the_categorys_positions():
+    guild = Guild(OPS)
+    school = guild.categories[1]
+    office, first, second = school.voice_channels
+    assert position_payload(school,[office,second,first]) == [{'id' : second.id, 'position' : 4},{'id' : first.id, 'position' : 5}]
+    assert position_payload(school,[office,first,second]) == []
+
+
+def test_payload_moves_channels_into_the_category():
+    guild = Guild(OPS)
+    ops, school = guild.categories
+    bravo = ops.voice_channels[1]
+    office, first, second = school.voice_channels
+    assert position_payload(school,[office,bravo,first,second]) == [
+        {'id' : office.id, 'position' : 1},
+        {'id' : bravo.id, 'position' : 3, 'parent_id' : school.id}]
+
+
+def test_swap_in_second_category():
+    guild = Guild(OPS)
+    layout = {'School' : ['Headteachers Office','Classroom 2','Classroom 1']}
+    reconcile(guild,layout)
+    assert guild.layout() == {'Ops' : OPS['Ops'], 'School' : layout['School']}
+    assert len(guild.bulkCalls) == 1
+
+
+def test_insert_before_the_create_is_cached():
+    guild = Guild(OPS)
+    layout = {'School' : ['Headteachers Office','Classroom 0','Classroom 1','Classroom 2']}
+    result = reconcile(guild,layout)
+    assert [step.action for step in result.done] == ['create','move']
+    assert guild.layout()['School'] == layout['School']
+
+
+def test_move_between_categories():
+    guild = Guild(OPS)
+    layout = {'Ops' : ['Alpha','Charlie'], 'School' : ['Headteachers Office','Bravo','Classroom 1','Classroom 2']}
+    reconcile(guild,layout)
+    assert guild.layout() == layout
+
+
+def test_adding_classrooms_only_creates():
+    guild = Guild({'School' : ['Headteachers Office'] + [f'Classroom {i+1}' for i in range(6)]})
+    layout = {'School' : ['Headteachers Office'] + [f'Classroom {i+1}' for i in range(8)]}
+    result = reconcile(guild,layout)
+    assert [step.action for step in result.done] == ['create','create']
+    assert guild.bulkCalls == []
+    assert guild.layout() == layout
+
+
+def test_other_versions_edit_each_channel(monkeypatch):
+    monkeypatch.setattr(discord,'version_info',discord.version_info._replace(major=3))
+    guild = Guild(OPS)
+    layout = {'School' : ['Headteachers Office','Classroom 2','Classroom 1']}
+    reconcile(guild,layout)
+    assert guild.bulkCalls == []
+    assert guild.edits == 2
+    assert guild.layout() == {'Ops' : OPS['Ops'], 'School' : layout['School']}
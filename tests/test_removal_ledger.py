@@ -0,0 +1,179 @@
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+import opsignupclasses
+from opsignup import OpSignUp
+from opsignupclasses import RemovalLedger, SignUpSheet, signUpTypes
+
+from gateway import Gateway
+
+
+HEAVY = '<:Icon_Heavy_Assault:795726910344003605>'
+MEDIC = '<:Icon_Combat_Medic:795726867960692806>'
+INFIL = '<:Icon_Infiltrator:795726922264215612>' # 1 place
+MAX = '<:Icon_MAX:795726948365631559>' # closed
+
+
+def test_ledger_only_matches_its_own_key():
+    ledger = RemovalLedger()
+    ledger.expect('1',MEDIC)
+    assert not ledger.consume('2',MEDIC)
+    assert not ledger.consume('1',HEAVY)
+    assert ledger.consume('1',MEDIC)
+    assert not ledger.consume('1',MEDIC)
+
+
+def test_ledger_counts_repeated_removals():
+    ledger = RemovalLedger()
+    ledger.expect('1',MAX)
+    ledger.expect('1',MAX)
+    assert ledger.consume('1',MAX)
+    assert ledger.consume('1',MAX)
+    assert not ledger.consume('1',MAX)
+    assert ledger.pending == {}
+
+
+def test_ledger_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(opsignupclasses.time,'monotonic',lambda: now[0])
+    ledger = RemovalLedger(ttl=30)
+    ledger.expect('1',MAX)
+    now[0] += 20
+    ledger.expect('1',MAX)
+    now[0] += 15
+    assert ledger.consume('1',MAX) # Only the second is still live
+    assert not ledger.consume('1',MAX)
+
+
+def make_cog(gateway):
+    cog = OpSignUp(gateway.bot)
+    cog.renderQueue.window = 0
+    return cog
+
+
+async def post_sheet(cog,gateway,signup='soberdogs',*args):
+    obj = SignUpSheet(signUpTypes[signup],gateway.channel,*args)
+    await obj.send_message(SimpleNamespace(guild=gateway.guild),'Monday 8:30',gateway.guildCache)
+    cog.objDict[obj.messageHandlerID] = obj
+    cog.store.save(obj)
+    return obj
+
+
+async def open_sheet(gateway):
+    cog = make_cog(gateway)
+    return cog, await post_sheet(cog,gateway)
+
+
+def signed_up(obj):
+    return set(obj.memberIndex.items())
+
+
+def replay_store(cog,messageID):
+    """
+    The sheet as it would be read back after a restart
+    """
+    obj = None
+    for op, pendingID, data in cog.store.pending:
+        if pendingID != messageID:
+            continue
+        if op == 'snapshot':
+            obj = SignUpSheet.from_state(json.loads(data))
+        elif op == 'journal':
+            obj.apply_event(json.loads(data))
+    return obj
+
+
+def test_echo_does_not_swallow_another_users_unreact():
+    async def run():
+        gateway = Gateway()
+        cog, obj = await open_sheet(gateway)
+        messageID = obj.messageHandlerID
+
+        gateway.react(messageID,1,HEAVY)
+        await gateway.deliver(cog)
+        # 2 tries the closed MAX slot while 1 unreacts, and the
+        # bot's removal of 2's reaction is echoed after 1's event
+        gateway.react(messageID,2,MAX)
+        gateway.remove(messageID,1,HEAVY)
+        await gateway.deliver(cog,1)
+        assert gateway.events[-1][0] == 'remove' and gateway.events[-1][1].user_id == 2
+        await gateway.deliver(cog)
+
+        assert signed_up(obj) == set()
+        assert gateway.on_message(messageID) == set()
+        assert obj.removalLedger.pending == {}
+    asyncio.run(run())
+
+
+def test_slot_move_rejected_until_unreact():
+    async def run():
+        gateway = Gateway()
+        cog, obj = await open_sheet(gateway)
+        messageID = obj.messageHandlerID
+
+        gateway.react(messageID,1,HEAVY)
+        gateway.react(messageID,1,MEDIC)
+        gateway.remove(messageID,1,HEAVY)
+        gateway.react(messageID,1,MEDIC) # Still on the message, so no event
+        await gateway.deliver(cog)
+        # The medic react came while still on heavy, so it was taken off
+        assert signed_up(obj) == set()
+
+        gateway.react(messageID,1,MEDIC)
+        await gateway.deliver(cog)
+        assert signed_up(obj) == {('1',MEDIC)}
+        assert gateway.on_message(messageID) == {(1,MEDIC)}
+    asyncio.run(run())
+
+
+def test_waitlist_promotion_with_echoes_in_flight():
+    async def run():
+        gateway = Gateway()
+        cog, obj = await open_sheet(gateway)
+        messageID = obj.messageHandlerID
+
+        for userID in (1,2,3):
+            gateway.react(messageID,userID,INFIL)
+        gateway.react(messageID,2,MAX)
+        gateway.remove(messageID,1,INFIL)
+        await gateway.deliver(cog)
+
+        assert obj.reactions[INFIL].check_member('2')
+        assert list(obj.reactions[INFIL].waitlist) == ['3']
+        assert signed_up(obj) == {('2',INFIL),('3',INFIL)}
+        assert gateway.on_message(messageID) == {(2,INFIL),(3,INFIL)}
+    asyncio.run(run())
+
+
+def test_random_bursts_stay_in_sync():
+    async def run(seed):
+        rng = random.Random(seed)
+        gateway = Gateway()
+        cog, obj = await open_sheet(gateway)
+        messageID = obj.messageHandlerID
+        emojis = list(obj.reactions.keys())
+        users = range(1,13)
+
+        for step in range(600):
+            if rng.random() < 0.6:
+                userID = rng.choice(users)
+                emoji = rng.choice(emojis)
+                if rng.random() < 0.5:
+                    gateway.react(messageID,userID,emoji)
+                else:
+                    gateway.remove(messageID,userID,emoji)
+            else:
+                await gateway.deliver(cog,rng.randint(1,4))
+        await gateway.deliver(cog)
+
+        # Every signup is backed by a reaction and every reaction left is a signup
+        assert signed_up(obj) == {(str(userID),emoji) for userID, emoji in gateway.on_message(messageID)}
+        await cog.renderQueue.flush(messageID)
+        assert gateway.messages[messageID].edits > 0
+        assert signed_up(replay_store(cog,messageID)) == signed_up(obj)
+        return gateway.bot_removals
+
+    removals = [asyncio.run(run(seed)) for seed in range(20)]
+    assert all(removals)
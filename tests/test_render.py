@@ -0,0 +1,81 @@
+import asyncio
+import random
+
+from opsignupclasses import EMBED_FIELD_LIMIT, EMBED_MAX_CHARS, EMBED_MAX_FIELDS, FieldChunks
+
+from gateway import Gateway
+from test_removal_ledger import make_cog, post_sheet
+
+
+INFIL = '<:Icon_Infiltrator:795726922264215612>' # 1 place
+
+
+def check_chunks(chunks,entries):
+    """
+    chunks holds entries in order, each chunk fits a field
+    and no two neighbours would fit in one
+    """
+    fields = list(chunks)
+    assert ''.join(text for text, users in fields) == chunks.header + ''.join(entries.values())
+    assert sum(users for text, users in fields) == len(entries)
+    assert all(len(text) <= EMBED_FIELD_LIMIT for text, users in fields)
+    assert all(len(first) + len(second) > EMBED_FIELD_LIMIT for (first, a), (second, b) in zip(fields,fields[1:]))
+
+
+def test_chunks_follow_adds_and_removes():
+    rng = random.Random(12)
+    chunks = FieldChunks('\u200b')
+    entries = {}
+    for step in range(3000):
+        if entries and rng.random() < 0.45:
+            userID = rng.choice(list(entries))
+            del entries[userID]
+            chunks.remove(userID)
+        else:
+            userID = str(step)
+            entries[userID] = f'<@{userID}>' + 'x'*rng.randrange(40) + '\n'
+            chunks.add(userID,entries[userID])
+        if step % 50 == 0:
+            check_chunks(chunks,entries)
+    check_chunks(chunks,entries)
+
+
+def test_render_shows_everyone_it_can():
+    gateway = Gateway()
+    cog = make_cog(gateway)
+
+    async def scenario():
+        obj = await post_sheet(cog,gateway)
+        obj.add_signup('1',INFIL,'<@1>\n')
+        obj.add_signup('2',INFIL,'<@2>\n')
+        obj.add_signup('3',INFIL,'<@3>\n')
+        fields = [field.value for field in obj.render_embed().fields[obj.reactionFields[INFIL]:]]
+        assert fields[:2] == ['\u200b<@1>\n','*Waitlist:*\n<@2>\n<@3>\n']
+
+        obj.remove_signup('1',INFIL)
+        fields = [field.value for field in obj.render_embed().fields[obj.reactionFields[INFIL]:]]
+        assert fields[:2] == ['\u200b<@2>\n','*Waitlist:*\n<@3>\n']
+
+    asyncio.run(scenario())
+
+
+def test_long_rosters_stay_inside_the_embed_limits():
+    gateway = Gateway()
+    cog = make_cog(gateway)
+
+    async def scenario():
+        obj = await post_sheet(cog,gateway,'training','Galaxy drop training','Bring a galaxy')
+        slot = next(iter(obj.reactions))
+        for userID in range(3000):
+            obj.add_signup(str(userID),slot,f'<@{100000000000000000+userID}>\n')
+        for userID in range(0,3000,3):
+            obj.remove_signup(str(userID),slot)
+        embed = obj.render_embed()
+        assert len(embed.fields) <= EMBED_MAX_FIELDS
+        assert len(embed) <= EMBED_MAX_CHARS
+
+        shown = [field for field in embed.fields if field.name.startswith(obj.reactions[slot].symbol)]
+        assert shown[-1].name.endswith(f' (+{2000 - sum(field.value.count(chr(10)) for field in shown)} more)')
+        assert shown[0].value.startswith('\u200b<@100000000000000001>\n<@100000000000000002>\n<@100000000000000004>\n')
+
+    asyncio.run(scenario())
@@ -0,0 +1,103 @@
+import asyncio
+import random
+import sqlite3
+
+from signupstore import SignUpStore
+
+from gateway import Gateway
+from test_removal_ledger import make_cog, post_sheet
+
+
+SHEETS = [('soberdogs',),('squadleaders',),('training','Galaxy drop training','Bring a galaxy')]
+
+
+def make_store_cog(gateway,path):
+    cog = make_cog(gateway)
+    cog.store = SignUpStore(path,flushInterval=0.05,compactEvery=5)
+    return cog
+
+
+async def fill(cog,gateway,count,users,steps,seed):
+    """
+    Posts count sheets and replays random reaction bursts on them
+    through the reaction listeners
+    """
+    rng = random.Random(seed)
+    sheets = [await post_sheet(cog,gateway,*SHEETS[i % len(SHEETS)]) for i in range(count)]
+    for step in range(steps):
+        obj = rng.choice(sheets)
+        userID = rng.randint(1,users)
+        emoji = rng.choice(list(obj.reactions.keys()))
+        if rng.random() < 0.6:
+            gateway.react(obj.messageHandlerID,userID,emoji)
+        else:
+            gateway.remove(obj.messageHandlerID,userID,emoji)
+        if rng.random() < 0.3:
+            await gateway.deliver(cog,rng.randint(1,5))
+    await gateway.deliver(cog)
+    return sheets
+
+
+def states(cog):
+    return {messageID : obj.to_state()['reactions'] for messageID, obj in cog.objDict.items()}
+
+
+def test_restore_rebuilds_every_sheet(tmp_path):
+    path = str(tmp_path/'signups.db')
+
+    async def run():
+        gateway = Gateway()
+        cog = make_store_cog(gateway,path)
+        await cog.store.start()
+        sheets = await fill(cog,gateway,30,40,3000,1)
+
+        # Two sheets are long over and get archived
+        for obj in sheets[:2]:
+            obj.startTime = 0
+            obj.lastActive = 0
+        await cog.archive_sign_ups()
+        expected = states(cog)
+        await cog.shutdown()
+
+        connection = sqlite3.connect(path)
+        journal = connection.execute('SELECT COUNT(*) FROM journal').fetchone()[0]
+        connection.close()
+        assert journal > 0 # Restoring has to replay journals, not just read snapshots
+
+        restarted = make_store_cog(gateway,path)
+        await restarted.restore_sign_ups()
+        assert len(expected) == 28
+        assert states(restarted) == expected
+        assert set(restarted.archivedIDs) == {obj.messageHandlerID for obj in sheets[:2]}
+
+        # Nothing changed on discord while we were down, so reconciling changed nothing
+        assert all(op != 'journal' for op, messageID, data in restarted.store.pending)
+        await restarted.shutdown()
+    asyncio.run(run())
+
+
+def test_restore_picks_up_reactions_made_while_offline(tmp_path):
+    path = str(tmp_path/'signups.db')
+
+    async def run():
+        gateway = Gateway()
+        cog = make_store_cog(gateway,path)
+        await cog.store.start()
+        sheets = await fill(cog,gateway,3,20,300,2)
+        await cog.shutdown()
+
+        obj = sheets[0]
+        joined = next(userID for userID in range(100,200) if str(userID) not in obj.memberIndex)
+        emoji = next(iter(obj.reactions))
+        gateway.react(obj.messageHandlerID,joined,emoji)
+        left, leftEmoji = next(iter(obj.memberIndex.items()))
+        gateway.remove(obj.messageHandlerID,int(left),leftEmoji)
+        gateway.events.clear() # The bot was offline
+
+        restarted = make_store_cog(gateway,path)
+        await restarted.restore_sign_ups()
+        restored = restarted.objDict[obj.messageHandlerID]
+        assert restored.signed_up_to(str(joined)) == emoji
+        assert restored.signed_up_to(left) is None
+        await restarted.shutdown()
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+from opsignup import OpSignUp
+
+from gateway import Gateway
+from test_removal_ledger import make_cog
+
+
+SCHEDULE = 'soberdogs "Monday 8:30"\narmourdogs "Monday 8:30"'
+
+
+def command_context(gateway):
+    replies = []
+    async def send(text):
+        replies.append(text)
+    return SimpleNamespace(guild=gateway.guild,message=SimpleNamespace(attachments=[]),send=send), replies
+
+
+def schedule(cog,ctx):
+    return OpSignUp.schedule_sign_ups.callback(cog,ctx,schedule=SCHEDULE)
+
+
+def posted(cog):
+    return sorted((obj.signUpType,obj.date) for obj in cog.objDict.values())
+
+
+def test_overlapping_schedules_post_once():
+    async def run():
+        gateway = Gateway(0.01)
+        cog = make_cog(gateway)
+        ctx, replies = command_context(gateway)
+        await asyncio.gather(schedule(cog,ctx),
+                             schedule(cog,ctx))
+        assert posted(cog) == [('armourdogs','Monday 8:30'),('soberdogs','Monday 8:30')]
+        assert len(gateway.messages) == 2
+        assert sum(reply.count('already posted') for reply in replies) == 2
+    asyncio.run(run())
+
+
+def test_schedule_waits_for_a_signup_being_posted():
+    async def run():
+        gateway = Gateway(0.01)
+        cog = make_cog(gateway)
+        ctx, replies = command_context(gateway)
+        await asyncio.gather(OpSignUp.generic_signup.callback(cog,ctx,'soberdogs','Monday 8:30'),
+                             schedule(cog,ctx))
+        assert posted(cog) == [('armourdogs','Monday 8:30'),('soberdogs','Monday 8:30')]
+    asyncio.run(run())
+
+
+def test_archived_sheets_count_as_posted():
+    async def run():
+        gateway = Gateway()
+        cog = make_cog(gateway)
+        cog.archivedIDs[5] = ('soberdogs','Monday 8:30')
+        ctx, replies = command_context(gateway)
+        await schedule(cog,ctx)
+        assert posted(cog) == [('armourdogs','Monday 8:30')]
+        assert 'soberdogs Monday 8:30: already posted, 5' in replies[0]
+    asyncio.run(run())
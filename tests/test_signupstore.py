@@ -0,0 +1,37 @@
+import asyncio
+import json
+import sqlite3
+import zlib
+from types import SimpleNamespace
+
+from signupstore import SignUpStore
+
+
+def test_archive_keeps_type_and_date(tmp_path):
+    async def run():
+        store = SignUpStore(str(tmp_path/'signups.db'))
+        await store.start()
+        sheet = SimpleNamespace(messageHandlerID=7,signUpType='ncaf',date='Friday 8:00',to_state=lambda: {'signUpType' : 'ncaf'})
+        store.archive(sheet)
+        await store.flush()
+        assert await store.archived() == {7 : ('ncaf','Friday 8:00')}
+        assert await store.unarchive(7) == {'signUpType' : 'ncaf'}
+        await store.close()
+    asyncio.run(run())
+
+
+def test_old_archives_gain_type_and_date(tmp_path):
+    path = str(tmp_path/'signups.db')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE archive (message_id INTEGER PRIMARY KEY, state BLOB NOT NULL)')
+    state = {'signUpType' : 'training', 'date' : 'Monday 8:30'}
+    connection.execute('INSERT INTO archive VALUES (?,?)',(3,zlib.compress(json.dumps(state).encode())))
+    connection.commit()
+    connection.close()
+
+    async def run():
+        store = SignUpStore(path)
+        await store.start()
+        assert await store.archived() == {3 : ('training','Monday 8:30')}
+        await store.close()
+    asyncio.run(run())